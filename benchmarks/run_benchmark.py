@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+# Benchmark of the full alarm pipeline: builds and plays alarms with AlarmBuilder against
+# local stand-ins of the web services and reports the duration of each stage and the time
+# to first audio. Results are compared against a stored baseline.
+#
+# Audio is written to a null output, so playback does not take real time.
+# Decoding the synthesized speech requires ffmpeg, like on a real alarm.
+
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from alarmpi.core import alarm_builder, apaudio, apconfig, apcontent
+from alarmpi.handlers import get_bbc_news, get_next_trains, get_weather
+
+import stand_ins
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(BENCHMARK_DIR, "benchmark.yaml")
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+# Stages slower than the baseline by more than this fraction and by more than
+# the noise floor are reported as regressions
+DEFAULT_TOLERANCE = 0.2
+NOISE_FLOOR = 0.005  # seconds
+
+
+class NullOutput:
+    """Audio output discarding the audio. Writes return immediately instead of
+    at playback speed.
+    """
+
+    def __init__(self, device):
+        pass
+
+    def write(self, data):
+        pass
+
+    def drop(self):
+        pass
+
+    def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class TimedAlarmBuilder(alarm_builder.AlarmBuilder):
+    """AlarmBuilder recording the duration of each stage of a build."""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.timings = {}
+        self.section_names = {id(section): name for name, section in config["content"].items()}
+
+    @contextmanager
+    def timed(self, stage):
+        """Add the duration of the block to a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0) + time.perf_counter() - start
+
+    def generate_greeting(self, alarm_time=None):
+        with self.timed("greeting"):
+            return super().generate_greeting(alarm_time)
+
+    def build_content(self, section):
+        with self.timed(f"content:{self.section_names[id(section)]}"):
+            return super().build_content(section)
+
+    def get_tts_client(self):
+        client = super().get_tts_client()
+        synthesize = client.synthesize
+
+        def timed_synthesize(text, deadline=None):
+            with self.timed("tts"):
+                return synthesize(text, deadline)
+
+        client.synthesize = timed_synthesize
+        return client
+
+    def save_artifact(self):
+        with self.timed("encode"):
+            super().save_artifact()
+
+
+def reset_caches(cache_dir):
+    """Point the on-disk caches to an empty directory and clear in-memory caches,
+    so each run fetches, synthesizes and decodes everything.
+    """
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    alarm_builder.ARTIFACT_DIR = os.path.join(cache_dir, "alarm")
+    alarm_builder.ARTIFACT_AUDIO_FILE = os.path.join(alarm_builder.ARTIFACT_DIR, "alarm.wav")
+    alarm_builder.ARTIFACT_METADATA_FILE = os.path.join(alarm_builder.ARTIFACT_DIR, "alarm.json")
+    get_weather.ICON_CACHE_DIR = os.path.join(cache_dir, "weather_icons")
+    apaudio.pcm_cache = apaudio.PCMCache(os.path.join(cache_dir, "pcm"))
+    get_bbc_news._feed_cache.update({"etag": None, "last_modified": None, "stories": None})
+    apcontent.content_cache.clear()
+
+def run_once(config, cache_dir):
+    """Build and play an alarm, then build and stream an alarm and fetch trains.
+    Return:
+        a dict of stage durations in seconds
+    """
+    reset_caches(cache_dir)
+    builder = TimedAlarmBuilder(config)
+
+    with builder.timed("build"):
+        builder.build()
+    with builder.timed("play"):
+        builder.play()
+
+    streaming_builder = TimedAlarmBuilder(config)
+    streaming_builder.build_and_stream()
+
+    timings = builder.timings
+    timings["time_to_first_audio"] = streaming_builder.time_to_first_audio
+
+    start = time.perf_counter()
+    get_next_trains.TrainParser(config["plugins"]["HSL"]).run()
+    timings["trains"] = time.perf_counter() - start
+
+    return timings
+
+def summarize(runs):
+    """Compute the median, minimum and maximum of each stage over the runs."""
+    stages = {}
+    for run in runs:
+        for stage, duration in run.items():
+            if duration is not None:
+                stages.setdefault(stage, []).append(duration)
+
+    return {
+        stage: {"median": statistics.median(durations), "min": min(durations), "max": max(durations)}
+        for stage, durations in stages.items()
+    }
+
+def compare(summary, baseline, tolerance):
+    """Format a report of the stage medians against the baseline.
+    Return:
+        the report lines and the names of regressed stages
+    """
+    lines = [f"{'stage':<30} {'median':>8} {'min':>8} {'max':>8} {'baseline':>9} {'change':>8}"]
+    regressions = []
+    for stage, stats in summary.items():
+        line = f"{stage:<30} {stats['median']:>8.3f} {stats['min']:>8.3f} {stats['max']:>8.3f}"
+
+        expected = baseline.get("stages", {}).get(stage)
+        if expected:
+            change = stats["median"] / expected - 1
+            line += f" {expected:>9.3f} {change:>+8.0%}"
+            if change > tolerance and stats["median"] - expected > NOISE_FLOOR:
+                line += "  REGRESSION"
+                regressions.append(stage)
+
+        lines.append(line)
+
+    return lines, regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark alarm build and playback against local service stand-ins.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of measured runs. Defaults to 5")
+    parser.add_argument("--warmup", type=int, default=1, help="Number of runs to discard before measuring. Defaults to 1")
+    parser.add_argument("--latency", type=float, default=0.15,
+                        help="Mean response latency of the stand-ins in seconds. Defaults to 0.15")
+    parser.add_argument("--jitter", type=float, default=0.05,
+                        help="Maximum deviation from the mean latency in seconds. Defaults to 0.05")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the latency jitter")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Fraction a stage may be slower than the baseline before reported as a regression. "
+                             "Defaults to 0.2")
+    args = parser.parse_args()
+
+    # pydub decodes the stand-in MP3 responses and the wakeup song with ffmpeg
+    missing = [tool for tool in ("ffmpeg", "ffprobe") if shutil.which(tool) is None]
+    if missing:
+        sys.exit(f"The benchmark requires {' and '.join(missing)}, install ffmpeg to run it")
+
+    config = apconfig.AlarmConfig(CONFIG_FILE)
+    apaudio.player = apaudio.AudioPlayer(output_factory=NullOutput)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        credentials = os.path.join(tmp_dir, "openweathermap.key")
+        with open(credentials, "w") as f:
+            f.write("benchmark")
+        config["content"]["openweathermap.org"]["credentials"] = credentials
+
+        runs = []
+        with stand_ins.serve(args.latency, args.jitter, args.seed) as stand_in:
+            for i in range(args.warmup + args.runs):
+                timings = run_once(config, os.path.join(tmp_dir, "cache"))
+                if i >= args.warmup:
+                    runs.append(timings)
+
+    summary = summarize(runs)
+    settings = {"latency": args.latency, "jitter": args.jitter, "runs": args.runs}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("settings", {}).get("latency") != args.latency:
+            print(f"Note: baseline was measured with different stand-in settings: {baseline.get('settings')}")
+    elif not args.save_baseline:
+        print(f"No baseline found at {args.baseline}, run with --save-baseline to store one")
+
+    lines, regressions = compare(summary, baseline, args.tolerance)
+    print(f"{args.runs} runs, stand-in latency {args.latency}s ± {args.jitter}s, {sum(stand_in.requests.values())} requests")
+    print("\n".join(lines))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {"settings": settings, "stages": {stage: stats["median"] for stage, stats in summary.items()}},
+                f, indent=2
+            )
+        print(f"Saved baseline to {args.baseline}")
+
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,186 @@
+# Local stand-ins for the web services used in an alarm build. A threaded HTTP server
+# replays recorded responses with a configurable latency and requests sent through
+# the shared HTTP session are redirected to it with a transport adapter.
+
+import math
+import os
+import random
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from requests.adapters import HTTPAdapter
+
+from alarmpi.utils import http_client, utils
+
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+WEATHER_ICON = os.path.join(utils.BASE, "resources", "icons", "moon64x64.png")
+
+# A silent MPEG-1 Layer III frame: 128kbps, 44.1kHz, mono. Each frame is 1152 samples.
+MP3_FRAME = bytes([0xFF, 0xFB, 0x90, 0xC4]) + bytes(413)
+MP3_FRAME_DURATION = 1152 / 44100  # seconds
+SPEECH_RATE = 14  # characters per second of synthesized speech
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def read_recording(name):
+    return read_file(os.path.join(RECORDINGS_DIR, name))
+
+
+def synthesize_speech(query):
+    """translate_tts stand-in: return silent mp3 audio as long as the text would take to speak."""
+    text = query.get("q", [""])[0]
+    frames = math.ceil(len(text) / SPEECH_RATE / MP3_FRAME_DURATION)
+    return "audio/mpeg", MP3_FRAME * frames
+
+
+# (host, path prefix) mapped to a function returning the content type and body of a response
+ROUTES = {
+    ("feeds.bbci.co.uk", "/news/world/rss.xml"):
+        lambda query: ("application/rss+xml", read_recording("bbc_world_rss.xml")),
+    ("api.openweathermap.org", "/data/2.5/weather"):
+        lambda query: ("application/json", read_recording("openweathermap_weather.json")),
+    ("openweathermap.org", "/img/wn/"):
+        lambda query: ("image/png", read_file(WEATHER_ICON)),
+    ("rata.digitraffic.fi", "/api/v1/live-trains/station/"):
+        lambda query: ("application/json", read_recording("digitraffic_live_trains.json")),
+    ("translate.google.com", "/translate_tts"): synthesize_speech,
+}
+HOSTS = {
+    "feeds.bbci.co.uk": "https",
+    "api.openweathermap.org": "http",
+    "openweathermap.org": "http",
+    "rata.digitraffic.fi": "https",
+    "translate.google.com": "https",
+}
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    """Serve requests to /<host>/<path> from the matching route after a delay."""
+    protocol_version = "HTTP/1.1"  # keep connections alive like the real services
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        host, _, path = url.path.lstrip("/").partition("/")
+        path = "/" + path
+
+        route = next(
+            (func for (route_host, prefix), func in ROUTES.items() if route_host == host and path.startswith(prefix)),
+            None
+        )
+        time.sleep(self.server.stand_in.get_delay())
+        self.server.stand_in.count_request(host)
+
+        if route is None:
+            content_type, body, status = "text/plain", b"Not found", 404
+        else:
+            content_type, body = route(urllib.parse.parse_qs(url.query))
+            status = 200
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer:
+    """Threaded HTTP server for the stand-ins. Each response is delayed by the latency
+    plus a uniformly distributed jitter.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=None):
+        """Args:
+            latency (float): mean response delay in seconds
+            jitter (float): maximum deviation from the mean delay in seconds
+            seed (int): seed for the jitter, for repeatable delays
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.requests = {}
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInRequestHandler)
+        self.server.daemon_threads = True
+        self.server.stand_in = self
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def get_delay(self):
+        with self.lock:
+            return max(0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def count_request(self, host):
+        with self.lock:
+            self.requests[host] = self.requests.get(host, 0) + 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class StandInAdapter(HTTPAdapter):
+    """Transport adapter sending requests for a host to the stand-in server. Pooled
+    like the shared session's own adapters.
+    """
+
+    def __init__(self, base_url):
+        super().__init__(
+            pool_connections=http_client.POOL_CONNECTIONS,
+            pool_maxsize=http_client.POOL_MAXSIZE,
+            pool_block=True
+        )
+        self.base_url = base_url
+
+    def send(self, request, **kwargs):
+        url = urllib.parse.urlsplit(request.url)
+        request.url = f"{self.base_url}/{url.netloc}{url.path}"
+        if url.query:
+            request.url += f"?{url.query}"
+        return super().send(request, **kwargs)
+
+
+@contextmanager
+def serve(latency=0.0, jitter=0.0, seed=None, session=http_client.session):
+    """Run the stand-in server and redirect requests to the stand-in hosts to it.
+    Args:
+        latency (float): mean response delay in seconds
+        jitter (float): maximum deviation from the mean delay in seconds
+        seed (int): seed for the jitter
+        session (requests.Session): the session to redirect
+    Yields:
+        the running StandInServer
+    """
+    stand_in = StandInServer(latency, jitter, seed)
+    stand_in.start()
+
+    adapters = dict(session.adapters)
+    for host, scheme in HOSTS.items():
+        session.mount(f"{scheme}://{host}/", StandInAdapter(stand_in.base_url))
+
+    try:
+        yield stand_in
+    finally:
+        session.adapters.clear()
+        session.adapters.update(adapters)
+        stand_in.stop()
+
@@ -7,10 +7,9 @@ import argparse
 import logging
 import logging.config
 import sys
+from contextlib import nullcontext
 
-from PyQt5.QtWidgets import QApplication
-
-from alarmpi.core import clock
+from alarmpi.utils import startup_profile
 
 
 logging.config.fileConfig("logging.conf")
@@ -50,6 +49,8 @@ def run():
                         help="fullscreen mode")
     parser.add_argument("--debug", action="store_true",
                         help="debug mode")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="log import and startup phase timings once the clock is running")
     args = parser.parse_args()
 
     if args.config == parser.get_default("config"):
@@ -58,9 +59,23 @@ def run():
     kwargs = vars(args)
     config = kwargs.pop("config")
 
-    app = QApplication(sys.argv)
-    with open("style.qss") as f:
-        app.setStyleSheet(f.read())
+    # Qt and the clock are imported here to include them in the startup profile
+    profiler = None
+    if kwargs.pop("profile_startup"):
+        profiler = startup_profile.StartupProfiler()
+        profiler.enable()
+
+    def phase(name):
+        return profiler.phase(name) if profiler else nullcontext()
+
+    with phase("Import Qt"):
+        from PyQt5.QtCore import QTimer
+        from PyQt5.QtWidgets import QApplication
+
+    with phase("Create application"):
+        app = QApplication(sys.argv)
+        with open("style.qss") as f:
+            app.setStyleSheet(f.read())
 
     if args.debug:
         # Add visible border around elements
@@ -71,8 +86,20 @@ def run():
         for handler in event_logger.handlers:
             handler.setLevel(logging.DEBUG)
 
-    ex = clock.Clock(config, **kwargs)
-    ex.setup()
+    with phase("Import clock"):
+        from alarmpi.core import clock
+
+    # Paint the clock before setting up the alarm and plugins
+    with phase("Show clock"):
+        ex = clock.Clock(config, **kwargs)
+        app.processEvents()
+
+    with phase("Setup alarm and plugins"):
+        ex.setup()
+
+    if profiler:
+        QTimer.singleShot(0, profiler.report)
+
     res = app.exec_()
 
     sys.exit(res)
@@ -160,18 +160,44 @@ class AlarmWindow(QWidget):
         self.show()
 
     def setup_clock_polling(self):
-        """Set the main LCD display to the current time and start polling for
-        with 1 second intervals.
+        """Set the main LCD display to the current time and update it at the start
+        of each second.
         """
+        self.clock_text = None
+        self.clock_date = None
+        self.clock_timer = QTimer(self)
+        self.clock_timer.setSingleShot(True)
+        self.clock_timer.setTimerType(Qt.PreciseTimer)
+        self.clock_timer.timeout.connect(self.tick)
+        self.tick()
+
+    def tick(self):
+        """Update the clock and schedule the next update to the next second boundary.
+        The date label is only updated when the date changes.
+        """
+        now = time.time()
+        local_time = time.localtime(now)
+
+        clock_text = time.strftime("%H:%M:%S", local_time)
+        if clock_text != self.clock_text:
+            self.clock_lcd.display(clock_text)
+            self.clock_text = clock_text
+
+        date = local_time[:3]
+        if date != self.clock_date:
+            self.date_label.setText(time.strftime("%a %d.%m.%Y", local_time))
+            self.clock_date = date
+
+        self.clock_timer.start(1000 - int(now * 1000) % 1000)
 
-        def tick():
-            self.clock_lcd.display(time.strftime("%H:%M:%S"))
-            self.date_label.setText(time.strftime("%a %d.%m.%Y"))
+    def pause_clock(self):
+        """Stop updating the clock, eg. while the screen is off."""
+        self.clock_timer.stop()
 
-        tick()  # Call tick once to set the initial time
-        _timer = QTimer(self)
-        _timer.timeout.connect(tick)
-        _timer.start(1000)
+    def resume_clock(self):
+        """Update the clock to the current time and resume the updates."""
+        if not self.clock_timer.isActive():
+            self.tick()
 
     def center(self):
         qr = self.frameGeometry()
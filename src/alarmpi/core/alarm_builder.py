@@ -1,22 +1,39 @@
-import glob
 import importlib
 import inspect
+import json
 import logging
 import os
-import random
+import queue
 import requests.exceptions
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime, timedelta
 
 import pydub
-import pydub.playback
 from PyQt5.QtCore import QThread, pyqtSignal
 
-from alarmpi.utils import utils
+from alarmpi.core import apaudio, aptts
+from alarmpi.utils import media_index, metrics, utils
 from alarmpi.handlers import get_festival_tts, get_greeting
 
 
 event_logger = logging.getLogger("eventLogger")
 
+# Defaults for the optional 'build' section of the main configuration
+DEFAULT_BUILD_WORKERS = 4
+DEFAULT_SECTION_TIMEOUT = 20  # seconds
+DEFAULT_TTS_RESERVE = 20  # seconds before a build deadline reserved for synthesizing
+DEFAULT_TTS_CACHE_SIZE = 50  # megabytes
+
+# Location of the prebuilt alarm: the audio and a metadata file describing its sections
+ARTIFACT_DIR = os.path.join(utils.CACHE_DIR, "alarm")
+ARTIFACT_AUDIO_FILE = os.path.join(ARTIFACT_DIR, "alarm.wav")
+ARTIFACT_METADATA_FILE = os.path.join(ARTIFACT_DIR, "alarm.json")
+
+BEEP_PATH = os.path.join(utils.BASE, "resources", "Cool-alarm-tone-notification-sound.mp3")
+
 
 class AlarmBuilder:
 
@@ -24,44 +41,215 @@ class AlarmBuilder:
         self.media_play_thread = MediaPlayWorker()
         self.config = config
         self.audio = None
-
-    def build(self):
+        self.time_to_first_audio = None
+        self.tts_cache = None
+        self.tts_client = None
+
+        # Content sections of the alarm being built and the synthesized
+        # audio of each section as (text, pydub.AudioSegment) pairs
+        self.contents = None
+        self.section_audio = []
+        self.media_index = None
+        self.cached_audio_paths = None  # audio files decoded to the PCM cache for the next alarm
+
+        # Latest content of each content section, used in place of a section
+        # missing its deadline
+        self.section_cache = {}
+
+        # Guards the finished alarm: prebuild stages replace it while the alarm may be playing it.
+        # Playing the alarm bumps the generation to discard results of stages still running.
+        self.lock = threading.Lock()
+        self.alarm_generation = 0
+
+    def build(self, deadline=None):
         """Loop through the configuration file for enabled content sections
         and generate content.
+        Args:
+            deadline (datetime): optional time by which the build should be finished
         """
-        # Initialize content with greeting
-        contents = []
-        contents.append(self.generate_greeting())
-
-        # For each content section get the handler module and create the approriate
-        # content parser
-        content_sections = self.config.get_enabled_sections("content")
-        for section in content_sections:
-            class_ = self.get_content_parser_class(content_sections[section])
-            parser = class_(content_sections[section])
-
-            # build content
-            parser.build()
-            contents.append(parser.get())
-
-        # Add ending phrase from the config file
-        contents.append(self.config["main"].get("end", ""))
-
-        for section in contents:
-            print(section)
+        self.fetch(deadline)
+        self.synthesize(deadline)
+
+    def fetch(self, deadline=None):
+        """Prebuild stage: fetch the content for the alarm. With a deadline, content
+        sections need to be ready the TTS reserve before it.
+        Args:
+            deadline (datetime): optional time by which the build should be finished
+        """
+        generation = self.alarm_generation
+        with metrics.timed("build", step="fetch"):
+            # Initialize the TTS client first to let it prepare while content is fetched
+            # and keep it ready for the synthesize stage
+            if self.config["main"]["TTS"]:
+                self.tts_client = self.get_tts_client()
+                self.tts_client.prepare(until=deadline)
+
+            content_deadline = None
+            if deadline is not None:
+                tts_reserve = self.config["main"].get("build", {}).get("tts_reserve", DEFAULT_TTS_RESERVE)
+                content_deadline = deadline - timedelta(seconds=tts_reserve)
+
+            contents = list(self.iter_contents(content_deadline))
+            for section in contents:
+                event_logger.debug("Alarm content: %s", section)
+
+            with self.lock:
+                if generation != self.alarm_generation:
+                    event_logger.warning("The alarm was played while fetching, discarding the content")
+                    return
+                self.contents = contents
+
+            # The wakeup song is chosen once per alarm, refresh stages keep it
+            if self.config["media"]["enabled"] and self.media_play_thread.song_path is None:
+                self.set_wakeup_song()
+
+            self.cache_decoded_audio()
+
+    def synthesize(self, deadline=None):
+        """Prebuild stage: synthesize the fetched content and save the alarm to disk.
+        Sections whose text has not changed since they were last synthesized are reused,
+        including sections of an alarm saved to disk before a restart. Of the changed
+        sections only new or changed sentences are synthesized if the TTS cache is enabled.
+        If the deadline passes before all changed sections are synthesized, any previously
+        built alarm is kept as is.
+        Args:
+            deadline (datetime): optional time by which synthesizing should be finished
+        """
+        if self.contents is None:
+            self.fetch(deadline)
 
-        if self.config["media"]["enabled"]:
-            files = glob.glob(self.config["media"]["path"])
-            wakeup_song_path = random.choice(files)
-            self.media_play_thread.song_path = wakeup_song_path
+        if not self.config["main"]["TTS"]:
+            return
 
-            event_logger.info("Set wakeup song to %s", wakeup_song_path)
+        generation = self.alarm_generation
+        with metrics.timed("build", step="synthesize"):
+            if self.tts_client is None:
+                self.tts_client = self.get_tts_client()
+            # Credentials prepared in the fetch stage may have expired since
+            self.tts_client.prepare()
+
+            with self.lock:
+                if not self.section_audio:
+                    self.load_artifact()
+                previous = dict(self.section_audio)
+
+            section_audio = []
+            deadline_missed = False
+            for text in self.contents:
+                if not text.strip():
+                    continue
+
+                audio = previous.get(text)
+                if audio is None:
+                    if deadline is not None and datetime.now() >= deadline:
+                        deadline_missed = True
+                        break
+                    try:
+                        audio = self.tts_client.synthesize(text, deadline=deadline)
+                    except Exception:
+                        # A request cut short by the deadline fails with an engine specific error
+                        if deadline is not None and datetime.now() >= deadline:
+                            deadline_missed = True
+                            break
+                        raise
+                section_audio.append((text, audio))
+
+            audio = aptts.join_segments([audio for _, audio in section_audio]) if section_audio else None
+            with self.lock:
+                if generation != self.alarm_generation:
+                    event_logger.warning("The alarm was played while synthesizing, discarding the result")
+                    return
+
+                if deadline_missed:
+                    metrics.record("build", 0, error=True, step="synthesize_deadline")
+                    if self.audio is not None:
+                        event_logger.warning("Synthesizing missed the deadline, keeping the previously built alarm")
+                        return
+                    event_logger.warning("Synthesizing missed the deadline, leaving out the remaining sections")
+
+                # Nothing to save, the beep is played in place of the alarm
+                if not section_audio:
+                    event_logger.warning("No sections synthesized, the alarm was not saved")
+                    return
+
+                event_logger.info(
+                    "Synthesized %s of %s sections",
+                    len([text for text, _ in section_audio if text not in previous]),
+                    len(section_audio)
+                )
+                self.section_audio = section_audio
+                self.audio = audio
+                self.save_artifact()
+            self.log_tts_cache_stats()
+
+    def refresh(self, deadline=None):
+        """Prebuild stage: refetch the content and re-synthesize only the sections
+        that changed.
+        Args:
+            deadline (datetime): optional time by which the refresh should be finished
+        """
+        self.fetch(deadline)
+        self.synthesize(deadline)
 
-        # Initialize TTS client with the generated content
-        if self.config["main"]["TTS"]:
-            self.tts_client = self.get_tts_client()
-            content_text = "\n".join(contents)
-            self.audio = self.tts_client.setup(content_text)
+    def get_alarm_id(self):
+        """Identify the upcoming alarm by its date and time, eg. '2024-05-01 07:00'.
+        An alarm time passed less than an hour ago is considered the upcoming alarm.
+        """
+        alarm_dt = utils.time_str_to_dt(self.config["main"]["alarm_time"])
+        if alarm_dt < datetime.now() - timedelta(hours=1):
+            alarm_dt += timedelta(days=1)
+
+        return alarm_dt.strftime("%Y-%m-%d %H:%M")
+
+    def save_artifact(self):
+        """Save the synthesized alarm to disk along with the text and length of each section."""
+        os.makedirs(ARTIFACT_DIR, exist_ok=True)
+        metadata = {
+            "alarm": self.get_alarm_id(),
+            "sections": [
+                {"text": text, "frames": int(audio.frame_count())}
+                for text, audio in self.section_audio
+            ]
+        }
+
+        # Write to temporary files first to keep a complete artifact on disk
+        # should the write be interrupted.
+        self.audio.export(f"{ARTIFACT_AUDIO_FILE}.tmp", format="wav")
+        with open(f"{ARTIFACT_METADATA_FILE}.tmp", "w") as f:
+            json.dump(metadata, f)
+
+        os.replace(f"{ARTIFACT_AUDIO_FILE}.tmp", ARTIFACT_AUDIO_FILE)
+        os.replace(f"{ARTIFACT_METADATA_FILE}.tmp", ARTIFACT_METADATA_FILE)
+        event_logger.info("Saved alarm for %s to %s", metadata["alarm"], ARTIFACT_AUDIO_FILE)
+
+    def load_artifact(self):
+        """Load an alarm saved to disk if it was built for the upcoming alarm.
+        Return:
+            True if an alarm was loaded
+        """
+        try:
+            with open(ARTIFACT_METADATA_FILE) as f:
+                metadata = json.load(f)
+            if metadata["alarm"] != self.get_alarm_id():
+                return False
+
+            audio = pydub.AudioSegment.from_wav(ARTIFACT_AUDIO_FILE)
+        except (OSError, ValueError, KeyError) as e:
+            event_logger.debug("No saved alarm loaded: %s", str(e))
+            return False
+
+        # Split the audio back to sections
+        section_audio = []
+        start = 0
+        for section in metadata["sections"]:
+            end = start + section["frames"]
+            section_audio.append((section["text"], audio.get_sample_slice(start, end)))
+            start = end
+
+        self.section_audio = section_audio
+        self.audio = audio
+        event_logger.info("Loaded saved alarm for %s", metadata["alarm"])
+        return True
 
     def play(self):
         """Play an alarm. Either play a pre-built alarm via the configured TTS client
@@ -76,41 +264,287 @@ class AlarmBuilder:
             AlarmBuilder.play_beep()
             return
 
+        # Take the last finished alarm without waiting for a prebuild stage running late,
+        # the results of any stage still running are discarded
+        with self.lock:
+            # Use an alarm saved to disk if the alarm was built before a restart
+            if self.audio is None and tts_enabled:
+                self.load_artifact()
+            audio = self.audio
+
+            # Reset audio and content for next alarm
+            self.audio = None
+            self.contents = None
+            self.alarm_generation += 1
+
         if wakeup_song_enabled: 
-            self.media_play_thread.start()
-            self.media_play_thread.wait()
-            self.media_play_thread.stop()
+            if self.media_play_thread.song_path is None:
+                self.set_wakeup_song()
+            self.play_wakeup_song()
 
-        if self.audio:
+        if audio:
             try:
-                self.tts_client.play(self.audio)
+                # Any TTS client can play the audio
+                tts_client = self.tts_client or aptts.AlarmpiTTS()
+                tts_client.play(audio)
             except (requests.exceptions.HTTPError, requests.exceptions.ConnectionError) as e:
                 event_logger.error(str(e))
                 event_logger.info("Defaulting to alarm sound effect")
                 AlarmBuilder.play_beep()
+        elif tts_enabled:
+            # The alarm was not built, eg. a prebuild stage failed or missed its deadline
+            event_logger.info("No alarm built, defaulting to alarm sound effect")
+            AlarmBuilder.play_beep()
 
-        # Reset audio for next alarm
-        self.audio = None
+        # Reset wakeup song for next alarm
+        self.media_play_thread.song_path = None
+        self.media_play_thread.song_name = None
 
     def build_and_play(self):
         """Build and play an alarm.
         This is provided as a CLI interface for playing the alarm.
-        Since the alarm is built on the go, there may be a few seconds delay on play.
+        The alarm is streamed: playback starts as soon as the greeting is synthesized.
         """
-        self.play()
+        self.build_and_stream()
 
         # Play the radio stream if enabled
         if self.config["radio"]["enabled"]:
             self.play_radio()
 
-    def generate_greeting(self):
+    def build_and_stream(self, on_first_audio=None, alarm_time=None):
+        """Build and play an alarm section by section. A producer thread synthesizes
+        the sections in order and queues the resulting audio while the calling thread
+        plays the queued audio. Playback starts as soon as the first section, the greeting,
+        is ready.
+        Args:
+            on_first_audio (callable): optional callback to run when the first section
+                is ready to be played.
+            alarm_time (str): time to announce in the greeting in HH:MM, defaults to
+                the configured alarm time
+        """
+        if not self.config["main"]["TTS"]:
+            if self.config["media"]["enabled"]:
+                self.set_wakeup_song()
+            self.play()
+            return
+
+        self.tts_client = self.get_tts_client()
+        self.tts_client.prepare()
+        audio_queue = queue.Queue()
+        start = time.monotonic()
+
+        producer = threading.Thread(target=self._synthesize_sections, args=(audio_queue, alarm_time), daemon=True)
+        producer.start()
+
+        # Sections are synthesized in the background while the wakeup song plays
+        if self.config["media"]["enabled"]:
+            self.set_wakeup_song()
+            self.play_wakeup_song()
+
+        self.time_to_first_audio = None
+        while (audio := audio_queue.get()) is not None:
+            if self.time_to_first_audio is None:
+                self.time_to_first_audio = time.monotonic() - start
+                event_logger.info("Time to first audio: %.2fs", self.time_to_first_audio)
+                metrics.record("build", self.time_to_first_audio, step="first_audio")
+                if on_first_audio:
+                    on_first_audio()
+
+            try:
+                self.tts_client.play(audio)
+            except (requests.exceptions.HTTPError, requests.exceptions.ConnectionError) as e:
+                event_logger.error(str(e))
+
+        self.log_tts_cache_stats()
+
+        # Default to the beep if nothing could be synthesized
+        if self.time_to_first_audio is None:
+            event_logger.info("Defaulting to alarm sound effect")
+            AlarmBuilder.play_beep()
+
+    def _synthesize_sections(self, audio_queue, alarm_time=None):
+        """Producer for build_and_stream: synthesize each alarm section in order and
+        add the results to a queue. A section failing to synthesize is skipped.
+        A None is added to the queue after the last section.
+        Args:
+            audio_queue (queue.Queue): queue for the synthesized pydub.AudioSegments
+            alarm_time (str): time to announce in the greeting
+        """
+        try:
+            for section in self.iter_contents(alarm_time=alarm_time):
+                event_logger.debug("Alarm content: %s", section)
+                if not section.strip():
+                    continue
+
+                try:
+                    audio_queue.put(self.tts_client.synthesize(section))
+                except Exception as e:
+                    event_logger.error("Failed to synthesize section: %s", str(e))
+        finally:
+            audio_queue.put(None)
+
+    def iter_contents(self, deadline=None, alarm_time=None):
+        """Generate the alarm content section by section: the greeting, enabled content
+        sections and the ending phrase. Content sections are fetched in the background
+        while earlier sections are being consumed.
+        Args:
+            deadline (datetime): optional time by which content sections should be ready
+            alarm_time (str): time to announce in the greeting, defaults to the configured alarm time
+        """
+        contents = self.fetch_contents(deadline)
+        yield self.generate_greeting(alarm_time)
+        yield from contents
+
+        # Add ending phrase from the config file
+        yield self.config["main"].get("end", "")
+
+    def fetch_contents(self, deadline=None):
+        """Start building all enabled content sections. The sections are built concurrently
+        in a bounded thread pool, each with its own timeout counted from when the sections
+        were submitted, cut short by the deadline. The total wait is thus bounded by the
+        longest timeout, not the sum of the timeouts.
+        Sections failing or timing out are replaced by their previously fetched content,
+        or left out of the alarm if there is none.
+        Args:
+            deadline (datetime): optional time by which the sections should be ready
+        Return:
+            a generator yielding content strings in the order they appear in the configuration
+        """
+        build_config = self.config["main"].get("build", {})
+        workers = build_config.get("workers", DEFAULT_BUILD_WORKERS)
+        default_timeout = build_config.get("timeout", DEFAULT_SECTION_TIMEOUT)
+
+        content_sections = self.config.get_enabled_sections("content")
+
+        # Note: the executor is not used as a context manager since exiting it would block
+        # until any timed out handlers finish.
+        executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="content")
+        submitted_at = time.monotonic()
+        futures = {
+            section: executor.submit(self.build_content, content_sections[section])
+            for section in content_sections
+        }
+        executor.shutdown(wait=False)
+
+        # Each section is waited for until its timeout after submitting
+        wait_until = {
+            section: submitted_at + content_sections[section].get("timeout", default_timeout)
+            for section in content_sections
+        }
+        return self._collect_contents(futures, wait_until, deadline)
+
+    def _collect_contents(self, futures, wait_until, deadline=None):
+        """Wait for content section futures in order and yield their results.
+        Args:
+            futures (dict): content section names mapped to their futures
+            wait_until (dict): content section names mapped to the time.monotonic() time
+                until which they are waited for
+            deadline (datetime): optional time after which sections are no longer waited for
+        """
+        for section, future in futures.items():
+            timeout = wait_until[section] - time.monotonic()
+            if deadline is not None:
+                timeout = min(timeout, (deadline - datetime.now()).total_seconds())
+            timeout = max(0, timeout)
+
+            try:
+                content = future.result(timeout=timeout)
+            except TimeoutError:
+                event_logger.error("Content section %s timed out", section)
+                metrics.record("content_timeout", timeout, error=True, section=section)
+            except Exception as e:
+                event_logger.error("Content section %s failed: %s", section, str(e))
+            else:
+                self.section_cache[section] = content
+                yield content
+                continue
+
+            content = self.section_cache.get(section)
+            if content is None:
+                event_logger.info("Skipping content section %s", section)
+            else:
+                event_logger.info("Using previously fetched content for %s", section)
+                yield content
+
+    def build_content(self, section):
+        """Create a content parser for a configuration section and build its content.
+        Args:
+            section (dict): a content section of the configuration file
+        Return:
+            the content as string
+        """
+        with metrics.timed("content", handler=section["handler"]):
+            class_ = self.get_content_parser_class(section)
+            parser = class_(section)
+            parser.build()
+            return parser.get()
+
+    def set_wakeup_song(self):
+        """Choose a wakeup song from the configured media path. The media index is
+        synced with the path first, only reading metadata of new or modified files.
+        """
+        if self.media_index is None:
+            self.media_index = media_index.MediaIndex()
+
+        self.media_index.update(self.config["media"]["path"])
+        song = self.media_index.choose(self.config["media"].get("no_repeat", True))
+        if song is None:
+            event_logger.error("No wakeup songs found in %s", self.config["media"]["path"])
+            return
+
+        wakeup_song_path = song["path"]
+        self.media_play_thread.song_path = wakeup_song_path
+        self.media_play_thread.song_name = (song["artist"] + " - " + song["title"]).lstrip("- ")
+        self.media_play_thread.cache_decoded = self.config["media"].get("cache_decoded", False)
+
+        event_logger.info("Set wakeup song to %s", wakeup_song_path)
+
+    def play_wakeup_song(self):
+        """Play the chosen wakeup song and wait for it to finish. The song is marked
+        played in the media index as playback starts.
+        """
+        if self.media_play_thread.song_path is None:
+            return
+
+        if self.media_index is not None:
+            self.media_index.mark_played(self.media_play_thread.song_path)
+        self.media_play_thread.start()
+        self.media_play_thread.wait()
+
+    def cache_decoded_audio(self):
+        """Decode the alarm beep and, if enabled, the wakeup song to the PCM cache
+        ahead of the alarm, so they can be played without decoding. Cached copies
+        of previous wakeup songs are removed. Nothing is done if the files were
+        already cached by an earlier stage.
+        """
+        paths = [BEEP_PATH]
+        if self.media_play_thread.cache_decoded and self.media_play_thread.song_path:
+            paths.append(self.media_play_thread.song_path)
+
+        if paths == self.cached_audio_paths:
+            return
+
+        try:
+            apaudio.pcm_cache.prune(paths)
+            for path in paths:
+                apaudio.pcm_cache.load(path)
+        except Exception as e:
+            event_logger.error("Failed to cache decoded audio: %s", str(e))
+            return
+
+        self.cached_audio_paths = paths
+
+    def generate_greeting(self, alarm_time=None):
         """Generate a greeting using get_greeting.py handler.
+        Args:
+            alarm_time (str): time to announce in HH:MM, defaults to the configured alarm time
         Return:
             the greeting as string.
         """
-        greeter = get_greeting.Greeting(self.config)
-        greeter.build()
-        return greeter.get()
+        with metrics.timed("content", handler="get_greeting.py"):
+            greeter = get_greeting.Greeting(self.config, alarm_time)
+            greeter.build()
+            return greeter.get()
 
     def get_tts_client(self):
         """Determine which TTS engine to use based on the enabled tts sections
@@ -133,8 +567,27 @@ class AlarmBuilder:
             event_logger.info("No TTS engine specified in config, using Festival")
             client = get_festival_tts.FestivalTTSManager()
 
+        client.cache = self.get_tts_cache()
         return client
 
+    def get_tts_cache(self):
+        """Return the shared TTS audio cache, or None if disabled in the config."""
+        cache_config = self.config.config.get("tts_cache", {})
+        if not cache_config.get("enabled"):
+            return None
+
+        if self.tts_cache is None:
+            max_size = cache_config.get("max_size", DEFAULT_TTS_CACHE_SIZE) * 1024**2
+            self.tts_cache = aptts.TTSCache(os.path.join(utils.CACHE_DIR, "tts"), max_size)
+
+        return self.tts_cache
+
+    def log_tts_cache_stats(self):
+        """Log TTS cache hit and miss counters if the cache is enabled."""
+        if self.tts_cache is not None:
+            stats = self.tts_cache.stats()
+            event_logger.info("TTS cache: %s hits, %s misses", stats["hits"], stats["misses"])
+
     def get_content_parser_class(self, section):
         """Given config file section name, return the class matching the handler."""
         # use importlib to dynamically import the correct module within
@@ -161,11 +614,14 @@ class AlarmBuilder:
     @staticmethod
     def play_beep():
         """Play a beeping sound effect."""
-        path = os.path.join(utils.BASE, "resources", "Cool-alarm-tone-notification-sound.mp3")
-        beep = pydub.AudioSegment.from_mp3(path)
-        pydub.playback.play(beep)
+        # Decoded on first use, the cached copy plays without decoding
+        try:
+            beep = apaudio.pcm_cache.load(BEEP_PATH)
+        except OSError:
+            beep = pydub.AudioSegment.from_mp3(BEEP_PATH)
+        apaudio.player.play(beep)
 
-        return path
+        return BEEP_PATH
 
 
 class MediaPlayWorker(QThread):
@@ -176,25 +632,40 @@ class MediaPlayWorker(QThread):
     def __init__(self):
         super().__init__()
         self.song_path = None
-        self.process = None
+        self.song_name = None  # name to display, read from the song's metadata if not set
+        self.cache_decoded = False  # play the song from the decoded PCM cache
 
     def run(self):
-        """Start a vlc process and notify the GUI to display a window during the playback."""
-        # Format a song name to display
-        metadata = utils.get_mp3_metadata(self.song_path)
-        song_name = (metadata["artist"] + " - " + metadata["title"]).lstrip("- ")
+        """Play the song in the shared audio player and notify the GUI to display
+        a window during the playback.
+        """
+        try:
+            self._play_song()
+        finally:
+            self.play_finished_signal.emit(1)
+
+    def _play_song(self):
+        """Decode and play the song, waiting for it to finish."""
+        song_name = self.song_name
+        if song_name is None:
+            # Format a song name to display
+            metadata = utils.get_mp3_metadata(self.song_path)
+            song_name = (metadata["artist"] + " - " + metadata["title"]).lstrip("- ")
 
         self.play_started_signal.emit(song_name)
-        self.process = subprocess.run(["/usr/bin/cvlc", self.song_path, "vlc://quit"])
+        try:
+            if self.cache_decoded:
+                song = apaudio.pcm_cache.load(self.song_path)
+            else:
+                song = pydub.AudioSegment.from_file(self.song_path)
+        except Exception as e:
+            event_logger.error("Failed to decode %s: %s", self.song_path, str(e))
+            return
+
+        apaudio.player.play(song)
 
     def stop(self):
-        """Terminate the thread."""
+        """Stop the playback. The audio still buffered is discarded."""
         event_logger.debug("Stopping media thread")
         self.play_finished_signal.emit(1)
-        # The vlc process needs to be explicitely terminated
-        try:
-            subprocess.run(["killall", "-9", "vlc"], stderr=subprocess.DEVNULL)
-            self.process.terminate()
-
-        except AttributeError:
-            return
\ No newline at end of file
+        apaudio.player.stop()
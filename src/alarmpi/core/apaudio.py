@@ -0,0 +1,301 @@
+# In-process audio playback shared by TTS, wakeup songs and the alarm beep.
+# A single output stream is kept open and fed from a bounded chunk queue by a writer
+# thread. Queued audio is played back to back without gaps and without spawning a
+# player process or writing temporary files for each clip.
+
+import hashlib
+import logging
+import mmap
+import os
+import queue
+import subprocess
+import threading
+import time
+
+try:
+    import alsaaudio
+except ImportError:
+    alsaaudio = None
+
+from alarmpi.utils import utils
+
+
+event_logger = logging.getLogger("eventLogger")
+
+
+OUTPUT_FRAME_RATE = 44100
+OUTPUT_CHANNELS = 2
+OUTPUT_SAMPLE_WIDTH = 2  # bytes, signed 16 bit little endian
+PERIOD_SIZE = 1024  # frames per write to the output device
+DEVICE_PERIODS = 4  # periods buffered by the output device, the pyalsaaudio default
+BUFFER_SECONDS = 2  # maximum amount of audio queued ahead of the output device
+
+CHUNK_BYTES = PERIOD_SIZE * OUTPUT_CHANNELS * OUTPUT_SAMPLE_WIDTH
+MAX_QUEUED_CHUNKS = BUFFER_SECONDS * OUTPUT_FRAME_RATE // PERIOD_SIZE
+
+
+class AlsaOutput:
+    """Output stream writing directly to an ALSA PCM device via pyalsaaudio."""
+
+    def __init__(self, device="default"):
+        self.pcm = alsaaudio.PCM(
+            alsaaudio.PCM_PLAYBACK,
+            device=device,
+            rate=OUTPUT_FRAME_RATE,
+            channels=OUTPUT_CHANNELS,
+            format=alsaaudio.PCM_FORMAT_S16_LE,
+            periodsize=PERIOD_SIZE
+        )
+
+    def write(self, data):
+        self.pcm.write(data)
+
+    def drop(self):
+        """Discard audio already buffered in the device."""
+        # PCM.drop is only available in newer pyalsaaudio versions
+        if hasattr(self.pcm, "drop"):
+            self.pcm.drop()
+
+    def drain(self):
+        """Wait until audio buffered in the device has been played."""
+        # Writes block while the device buffer is full, so at most the buffer is left to play.
+        # PCM.drain would stop the stream and fail subsequent writes.
+        time.sleep(DEVICE_PERIODS * PERIOD_SIZE / OUTPUT_FRAME_RATE)
+
+    def close(self):
+        self.pcm.close()
+
+
+class AplayOutput:
+    """Output stream piping raw audio to a single long running aplay process.
+    Used when pyalsaaudio is not installed.
+    """
+
+    def __init__(self, device="default"):
+        cmd = [
+            "aplay", "-q", "-D", device, "-t", "raw", "-f", "S16_LE",
+            "-r", str(OUTPUT_FRAME_RATE), "-c", str(OUTPUT_CHANNELS)
+        ]
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def write(self, data):
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    def drop(self):
+        pass
+
+    def drain(self):
+        # Audio buffered by aplay is never dropped, so there is no need to wait for it
+        pass
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def create_output(device="default"):
+    """Open an output stream using pyalsaaudio if available."""
+    if alsaaudio is not None:
+        return AlsaOutput(device)
+    return AplayOutput(device)
+
+
+class AudioPlayer:
+    """Play pydub.AudioSegments through a shared output stream. Audio is converted
+    to a common sample format, split to chunks and queued for a writer thread.
+    """
+
+    def __init__(self, device="default", output_factory=create_output):
+        """Args:
+            device (str): the ALSA device to play to
+            output_factory (callable): function returning an output stream for a device
+        """
+        self.device = device
+        self.output_factory = output_factory
+        self.output = None
+        self.chunks = queue.Queue(maxsize=MAX_QUEUED_CHUNKS)
+        self.generation = 0  # incremented on stop to invalidate already queued chunks
+        self.lock = threading.Lock()
+        self.writer = None
+
+    def play(self, audio):
+        """Play audio and wait until it has been played or playback is stopped.
+        Args:
+            audio (pydub.AudioSegment): the audio to play
+        """
+        self.enqueue(audio).wait()
+
+    def enqueue(self, audio):
+        """Queue audio to be played right after any audio already queued. Blocks
+        while the queue is full.
+        Args:
+            audio (pydub.AudioSegment): the audio to play
+        Return:
+            a threading.Event set when the audio has been played or playback is stopped
+        """
+        self._start_writer()
+        done = threading.Event()
+        generation = self.generation
+        data = AudioPlayer.convert(audio).raw_data
+
+        for i in range(0, len(data), CHUNK_BYTES):
+            if generation != self.generation:
+                break
+            self.chunks.put((generation, data[i:i + CHUNK_BYTES]))
+
+        self.chunks.put((generation, done))
+        return done
+
+    def stop(self):
+        """Stop playback and discard all queued audio."""
+        with self.lock:
+            self.generation += 1
+
+        while True:
+            try:
+                _, item = self.chunks.get_nowait()
+            except queue.Empty:
+                break
+
+            if isinstance(item, threading.Event):
+                item.set()
+
+        if self.output is not None:
+            self.output.drop()
+
+    def close(self):
+        """Stop playback and close the output stream."""
+        self.stop()
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+
+    @staticmethod
+    def convert(audio):
+        """Convert audio to the output sample format."""
+        return (
+            audio.set_frame_rate(OUTPUT_FRAME_RATE)
+            .set_channels(OUTPUT_CHANNELS)
+            .set_sample_width(OUTPUT_SAMPLE_WIDTH)
+        )
+
+    def _start_writer(self):
+        """Start the writer thread on first use."""
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._write_chunks, daemon=True)
+                self.writer.start()
+
+    def _write_chunks(self):
+        """Writer thread: write queued chunks to the output stream. The stream is
+        opened on the first chunk. When the last queued audio is written, the output is
+        drained before signalling it has been played. On a write error the rest of the
+        queued audio is discarded and the stream is reopened for the next audio.
+        """
+        while True:
+            generation, item = self.chunks.get()
+            if isinstance(item, threading.Event):
+                if generation == self.generation and self.output is not None and self.chunks.empty():
+                    try:
+                        self.output.drain()
+                    except Exception as e:
+                        event_logger.error("Audio output failed: %s", str(e))
+                item.set()
+                continue
+
+            if generation != self.generation:
+                continue
+
+            try:
+                if self.output is None:
+                    self.output = self.output_factory(self.device)
+                self.output.write(item)
+            except Exception as e:
+                event_logger.error("Audio output failed: %s", str(e))
+                self.output = None
+                self.stop()
+
+
+class PCMCache:
+    """On-disk cache of audio files decoded to raw PCM in the output sample format.
+    Cached files are memory-mapped, so playing them needs no decoding and pages are
+    read from disk as playback proceeds.
+    """
+
+    def __init__(self, path):
+        """Args:
+            path (str): directory to store the decoded files in
+        """
+        self.path = path
+        self.lock = threading.Lock()
+
+    def load(self, source_path):
+        """Load an audio file, decoding it to the cache on first use.
+        Args:
+            source_path (str): path to the audio file
+        Return:
+            the audio as a memory-mapped pydub.AudioSegment
+        """
+        # pydub is imported on first use to keep it out of the GUI startup
+        import pydub
+
+        cache_path = self._get_file_path(source_path)
+
+        # Only one thread needs to decode a file missing from the cache
+        with self.lock:
+            if not os.path.exists(cache_path):
+                self._decode(source_path, cache_path)
+
+        # An empty file cannot be memory-mapped
+        if os.path.getsize(cache_path) == 0:
+            return AudioPlayer.convert(pydub.AudioSegment.empty())
+
+        with open(cache_path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return pydub.AudioSegment(
+            data=data,
+            sample_width=OUTPUT_SAMPLE_WIDTH,
+            frame_rate=OUTPUT_FRAME_RATE,
+            channels=OUTPUT_CHANNELS
+        )
+
+    def prune(self, keep):
+        """Remove cached files except for the given audio files.
+        Args:
+            keep (list): paths to the audio files whose cached copies to keep
+        """
+        keep = {os.path.basename(self._get_file_path(path)) for path in keep}
+        with self.lock:
+            os.makedirs(self.path, exist_ok=True)
+            for name in os.listdir(self.path):
+                if name not in keep:
+                    os.remove(os.path.join(self.path, name))
+
+    def _decode(self, source_path, cache_path):
+        """Decode an audio file to the output sample format and write it to the cache."""
+        import pydub
+
+        event_logger.info("Decoding %s to cache", source_path)
+        audio = AudioPlayer.convert(pydub.AudioSegment.from_file(source_path))
+
+        # Write to a temporary file first to never leave a partially written file
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio.raw_data)
+        os.replace(tmp_path, cache_path)
+
+    def _get_file_path(self, source_path):
+        """The cache file name is a hash of the source file path, size and
+        modification time. A modified source file is decoded again.
+        """
+        stat = os.stat(source_path)
+        source = f"{os.path.abspath(source_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        key = hashlib.sha256(source.encode()).hexdigest()
+        return os.path.join(self.path, key + ".pcm")
+
+
+player = AudioPlayer()
+pcm_cache = PCMCache(os.path.join(utils.CACHE_DIR, "pcm"))
@@ -102,10 +102,10 @@ class AlarmConfig:
             logger.warning("alarm_time %s is not valid, Defaulting to 07:00", self["main"]["alarm_time"])
             self["main"]["alarm_time"] = "07:00"
 
-        # Media path should contain at least 1 file. 
-        # Content of the file is *not* validated, vlc will silently ignore unsupported files.
+        # Media path should contain at least 1 file, the scan stops at the first match.
+        # Content of the file is *not* validated, unsupported files fail to decode on play.
         if self["media"]["enabled"]:
-            assert glob.glob(self["media"]["path"]), "Path to wakeup song is not valid"
+            assert next(glob.iglob(self["media"]["path"]), None), "Path to wakeup song is not valid"
 
         return True
 
@@ -1,7 +1,27 @@
+# Base class for alarm content handlers and a cache of handler results shared by
+# alarm builds and sidebar plugins.
+
+import logging
+import threading
+import time
+
+
+event_logger = logging.getLogger("eventLogger")
+
+
 class AlarmpiContent:
     """Base class for alarm content parsers. Defines common methods for 
     setting and getting alarm content to be played.
     """
+    # Number of seconds fetched data is shared through the content cache before it
+    # is refetched, None to not cache. Can be overridden with a cache_ttl key in
+    # the configuration section.
+    CACHE_TTL = None
+    # Number of seconds past the TTL the alarm may use stale data while it is refreshed
+    # in the background
+    CACHE_MAX_STALE = 0
+    # Number of seconds past the TTL stale data may be used in place of a failed fetch
+    CACHE_STALE_IF_ERROR = 0
 
     def __init__(self, section_data):
         """Create a an abstract content handler.
@@ -25,3 +45,118 @@ class AlarmpiContent:
         For reference see, implementation in handlers/get_greeting.py.
         """
         raise NotImplementedError
+
+    def cached(self, key, fetch, max_stale=0, stale_if_error=0):
+        """Get data through the shared content cache using the TTL of this handler.
+        Args:
+            key (tuple): identifies the data within this handler, eg. a city id
+            fetch (callable): function fetching the data
+            max_stale (int): number of seconds past the TTL stale data may be returned
+                while the data is refreshed in the background
+            stale_if_error (int): number of seconds past the TTL stale data may be
+                returned if the fetch fails
+        Return:
+            the return value of fetch, possibly from the cache
+        """
+        ttl = self.section_data.get("cache_ttl", self.CACHE_TTL)
+        if not ttl:
+            return fetch()
+
+        return content_cache.get((type(self).__name__,) + tuple(key), fetch, ttl, max_stale, stale_if_error)
+
+
+class ContentCache:
+    """In-memory cache of handler results with stale-while-revalidate: data older
+    than its TTL can still be returned immediately while a single background fetch
+    refreshes it. Concurrent requests for missing data share a single fetch.
+    Error results, None or dicts with an 'error' key, are not cached, but stale data
+    can be returned in their place.
+    """
+
+    def __init__(self):
+        self.entries = {}  # key: (data, fetch time)
+        self.refreshing = set()
+        self.fetch_locks = {}  # key: lock held while the data is fetched
+        self.lock = threading.Lock()
+
+    def get(self, key, fetch, ttl, max_stale=0, stale_if_error=0):
+        """Get data from the cache or fetch it.
+        Args:
+            key (hashable): key of the data
+            fetch (callable): function fetching the data
+            ttl (int): number of seconds the data is fresh
+            max_stale (int): number of seconds past the TTL stale data may be
+                returned while it is refreshed in the background
+            stale_if_error (int): number of seconds past the TTL stale data may be
+                returned if the fetch fails
+        Return:
+            the data
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry is not None:
+            data, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < ttl:
+                return data
+
+            if age < ttl + max_stale:
+                self._refresh_in_background(key, fetch)
+                return data
+
+        with self._get_fetch_lock(key):
+            # Use the data fetched by another thread while waiting for the lock
+            with self.lock:
+                entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < ttl:
+                return entry[0]
+
+            data = self._fetch(key, fetch)
+            if ContentCache.is_error(data) and entry is not None and time.monotonic() - entry[1] < ttl + stale_if_error:
+                event_logger.warning("Failed to fetch %s, using cached data", key)
+                return entry[0]
+
+            return data
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    @staticmethod
+    def is_error(data):
+        return data is None or (isinstance(data, dict) and "error" in data)
+
+    def _get_fetch_lock(self, key):
+        with self.lock:
+            return self.fetch_locks.setdefault(key, threading.Lock())
+
+    def _fetch(self, key, fetch):
+        """Fetch and cache data unless the fetch returns an error."""
+        data = fetch()
+        if not ContentCache.is_error(data):
+            with self.lock:
+                self.entries[key] = (data, time.monotonic())
+        return data
+
+    def _refresh_in_background(self, key, fetch):
+        """Start a background fetch for a key unless one is already running."""
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def refresh():
+            try:
+                with self._get_fetch_lock(key):
+                    self._fetch(key, fetch)
+            except Exception as e:
+                event_logger.error("Failed to refresh cached %s: %s", key, str(e))
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+content_cache = ContentCache()
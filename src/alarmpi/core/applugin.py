@@ -1,18 +1,206 @@
-from PyQt5.QtCore import QTimer
+import logging
+from functools import partial
+
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
+
+from alarmpi.utils import metrics
+
+
+# Use pluginLogger to send (frequent) error events to separate file in order to keep
+# main event log clean.
+plugin_logger = logging.getLogger("pluginLogger")
+
+DEFAULT_FETCH_TIMEOUT = 30  # seconds
+ERROR_HTML = "<html><span style='font-size:14px'>! not refreshed - {}</span></html>"
 
 
 class AlarmpiPlugin:
+    """Base class for sidebar plugins. Provides a background fetch executor: data is
+    fetched in a worker thread and passed back to the GUI thread via a signal.
+    """
 
     def __init__(self, parent):
         self.retry_flag = False
         self.parent = parent
+        self.view = LabelView()
+
+        self.fetch_worker = None
+        self.fetch_timer = QTimer(self.parent.main_window)
+        self.fetch_timer.setSingleShot(True)
+        self.fetch_timer.timeout.connect(self._handle_timeout)
+        self._on_timeout = None
+
+        # References to started workers, kept until they finish. Includes cancelled
+        # workers still running in the background.
+        self._workers = set()
+        self._pending_retry = None
+
+    def display_error(self, label, error):
+        """Display the status code of a failed fetch in a label.
+        Args:
+            label (QLabel): the label to display the error in
+            error (dict): the error response of the fetch
+        """
+        self.view.set_text(label, ERROR_HTML.format(error["error"]["status_code"]))
 
     def run_with_retry(self, func, delay_sec=10):
-        """Run func with single retry after a delay."""
+        """Run func with single retry after a delay. func is expected to start a fetch
+        with start_fetch; the retry is scheduled if retry_flag is set once the result
+        has been handled.
+        """
+        self._pending_retry = (func, delay_sec)
         func()
+
+    def start_fetch(self, fetch, on_result, timeout_sec=DEFAULT_FETCH_TIMEOUT, on_timeout=None):
+        """Run fetch in a worker thread and pass its return value to on_result in the
+        GUI thread. Any previous fetch still running is cancelled.
+        Args:
+            fetch (callable): function fetching the data, run in the worker thread
+            on_result (callable): slot receiving the return value of fetch
+            timeout_sec (int): number of seconds after which the fetch is cancelled
+            on_timeout (callable): optional slot to call on timeout. Defaults to
+                passing an error response to on_result.
+        """
+        self.cancel_fetch()
+
+        worker = FetchWorker(fetch, type(self).__name__)
+        worker.result_signal.connect(partial(self._handle_result, worker, on_result))
+        worker.finished.connect(partial(self._workers.discard, worker))
+        self._workers.add(worker)
+        self.fetch_worker = worker
+
+        if on_timeout is None:
+            on_timeout = partial(on_result, {"error": {"message": "Request timed out", "status_code": 504}})
+        self._on_timeout = on_timeout
+
+        worker.start()
+        self.fetch_timer.start(timeout_sec * 1000)
+
+    def cancel_fetch(self):
+        """Cancel a running fetch: its result will be discarded."""
+        self.fetch_timer.stop()
+        if self.fetch_worker is not None:
+            self.fetch_worker.cancel()
+            self.fetch_worker = None
+
+    def shutdown(self, timeout_msec=1000):
+        """Cancel any running fetch and wait for the worker threads to finish."""
+        self.cancel_fetch()
+        for worker in list(self._workers):
+            worker.wait(timeout_msec)
+
+    def _handle_result(self, worker, on_result, result):
+        """Slot for a finished fetch: pass the result to the plugin unless
+        the fetch was cancelled.
+        """
+        if worker.cancelled:
+            return
+
+        self.fetch_timer.stop()
+        self.fetch_worker = None
+        on_result(result)
+        self._schedule_pending_retry()
+
+    def _handle_timeout(self):
+        """Slot for the fetch timeout timer: cancel the running fetch."""
+        if self.fetch_worker is None:
+            return
+
+        plugin_logger.error("%s: fetch timed out", type(self).__name__)
+        self.cancel_fetch()
+        self._on_timeout()
+        self._schedule_pending_retry()
+
+    def _schedule_pending_retry(self):
+        """Schedule the retry requested by run_with_retry if retry_flag was set."""
+        if self._pending_retry is None:
+            return
+
+        func, delay_sec = self._pending_retry
+        self._pending_retry = None
         if self.retry_flag:
             self.retry_flag = False
             timer = QTimer(self.parent.main_window)
             timer.setSingleShot(True)
             timer.timeout.connect(func)
-            timer.start(delay_sec*1000)
\ No newline at end of file
+            timer.start(delay_sec*1000)
+
+
+class LabelView:
+    """View-model of plugin labels: keeps the content displayed in each label and
+    only updates labels whose content changed. Each update of a (rich-text) label
+    triggers a layout and repaint.
+    """
+
+    def __init__(self):
+        self.content = {}
+
+    def get(self, label):
+        """Return the content displayed in a label, None if nothing set."""
+        return self.content.get(label)
+
+    def set_text(self, label, text):
+        """Set the text of a label if it changed.
+        Return:
+            True if the label was updated
+        """
+        if self.content.get(label) == text:
+            return False
+
+        label.setText(text)
+        self.content[label] = text
+        return True
+
+    def set_pixmap(self, label, pixmap, key):
+        """Set the pixmap of a label if it changed.
+        Args:
+            label (QLabel): the label to update
+            pixmap (QPixmap): the pixmap to display
+            key (hashable): identifier of the pixmap's content, eg. an icon id
+        Return:
+            True if the label was updated
+        """
+        if self.content.get(label) == ("pixmap", key):
+            return False
+
+        label.setPixmap(pixmap)
+        self.content[label] = ("pixmap", key)
+        return True
+
+    def clear(self, label):
+        """Clear a label if it is not empty."""
+        return self.set_text(label, "")
+
+
+class FetchWorker(QThread):
+    """Worker for running a plugin's data fetch in a separate thread."""
+    result_signal = pyqtSignal(object)
+
+    def __init__(self, fetch, name=""):
+        """Args:
+            fetch (callable): function fetching the data
+            name (str): name of the fetching plugin for the metrics
+        """
+        super().__init__()
+        self.fetch = fetch
+        self.name = name
+        self.cancelled = False
+
+    def run(self):
+        with metrics.timed("plugin_fetch", plugin=self.name) as measurement:
+            try:
+                result = self.fetch()
+            except Exception as e:
+                plugin_logger.error("%s: %s", type(e).__name__, str(e))
+                result = {"error": {"message": str(e), "status_code": 500}}
+
+            measurement.error = isinstance(result, dict) and "error" in result
+
+        if not self.cancelled:
+            self.result_signal.emit(result)
+
+    def cancel(self):
+        """Mark the fetch as cancelled. A running fetch cannot be interrupted, but its
+        result is discarded.
+        """
+        self.cancelled = True
@@ -1,13 +1,115 @@
-import pydub.playback
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pydub
+
+from alarmpi.core import apaudio
+from alarmpi.utils import metrics
+
+
+event_logger = logging.getLogger("eventLogger")
+
+# Text is synthesized and cached in segments split at sentence ends and line breaks
+SEGMENT_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+class DeadlineExceeded(Exception):
+    """Raised when text could not be synthesized before its deadline."""
 
 
 class AlarmpiTTS:
     """Base class for TTS clients. Provide a common credentials argument
     and an abstract method for initializing the actual TTS client.
     """
+    # Name of the voice used by the engine, part of the cache key of synthesized audio
+    voice = ""
+    # Number of sentences missing from the cache synthesized at once
+    MAX_CONCURRENT_SEGMENTS = 4
 
     def __init__(self, auth: dict=None):
         self.auth = auth
+        self.cache = None
+        self.deadline = None  # deadline of the text being synthesized, see request_timeout
+
+    def synthesize(self, text, deadline=None):
+        """Transform text to audio. If a TTSCache is set, the text is synthesized sentence by
+        sentence and previously synthesized sentences are read from the cache. Only new or
+        changed sentences of an edited text are synthesized again, concurrently.
+        Args:
+            text (string): the textual content to be processed by the actual TTS client.
+            deadline (datetime): optional time by which the text should be synthesized.
+                Each request to the engine is limited to the time left.
+        Return:
+            Audio content to be played as pydub.AudioSegment
+        Raises:
+            DeadlineExceeded: if the deadline passed before the text was synthesized
+        """
+        self.deadline = deadline
+        if self.cache is None:
+            return self._timed_setup(text)
+
+        keys = []
+        segment_audio = {}
+        missing = {}
+        for segment in SEGMENT_BOUNDARY.split(text):
+            segment = segment.strip()
+            if not segment:
+                continue
+
+            key = TTSCache.key(type(self).__name__, self.voice, segment)
+            keys.append(key)
+            if key in segment_audio or key in missing:
+                continue
+
+            audio = self.cache.get(key)
+            if audio is None:
+                missing[key] = segment
+            else:
+                segment_audio[key] = audio
+
+        if missing:
+            executor = ThreadPoolExecutor(max_workers=min(self.MAX_CONCURRENT_SEGMENTS, len(missing)))
+            try:
+                futures = {key: executor.submit(self._timed_setup, segment) for key, segment in missing.items()}
+                for key, future in futures.items():
+                    segment_audio[key] = future.result()
+                    self.cache.put(key, segment_audio[key])
+            finally:
+                # Don't start the remaining requests if one failed
+                executor.shutdown(cancel_futures=True)
+
+        return join_segments([segment_audio[key] for key in keys])
+
+    def request_timeout(self, default=None):
+        """Time left for a request to the engine before the synthesizing deadline.
+        Args:
+            default: timeout to use when synthesizing has no deadline
+        Return:
+            the timeout in seconds or the default
+        Raises:
+            DeadlineExceeded: if the deadline has already passed
+        """
+        if self.deadline is None:
+            return default
+
+        timeout = (self.deadline - datetime.now()).total_seconds()
+        if timeout <= 0:
+            raise DeadlineExceeded("Synthesizing missed its deadline")
+        return timeout
+
+    def prepare(self, until=None):
+        """Prepare the client for synthesizing, eg. refresh credentials ahead of time.
+        Called at the start of an alarm build. Should not block.
+        Args:
+            until (datetime): optional time until which the client should stay ready,
+                eg. the deadline of a prebuilt alarm
+        """
+        pass
 
     def setup(self, text):
         """Setup any TTS client and make requests to transform text as audio
@@ -24,4 +126,118 @@ class AlarmpiTTS:
         Args:
             audio (pydub.AudioSegment): prebuilt content to be played
         """
-        pydub.playback.play(audio)
+        with metrics.timed("tts_play", engine=type(self).__name__):
+            apaudio.player.play(audio)
+
+    def _timed_setup(self, text):
+        """Call setup recording its duration in the metrics."""
+        self.request_timeout()
+        with metrics.timed("tts_setup", engine=type(self).__name__):
+            return self.setup(text)
+
+
+class TTSCache:
+    """Content-addressed on-disk cache for synthesized audio shared by all TTS engines.
+    Audio is stored as WAV to avoid an ffmpeg decode on cache hits. Least recently used
+    files are removed when the cache grows past its size limit.
+    """
+
+    def __init__(self, path, max_size):
+        """Args:
+            path (str): directory to store the audio files in
+            max_size (int): maximum size of the cache in bytes
+        """
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def key(engine, voice, text):
+        """Compute the cache key for a chunk of text synthesized with an engine and a voice."""
+        return hashlib.sha256("\0".join([engine, voice, text]).encode()).hexdigest()
+
+    def get(self, key):
+        """Read cached audio.
+        Return:
+            the cached audio as pydub.AudioSegment or None on a cache miss
+        """
+        path = self._get_file_path(key)
+        try:
+            audio = pydub.AudioSegment.from_wav(path)
+            # Mark the file as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            audio = None
+        except Exception as e:
+            event_logger.warning("Removing unreadable TTS cache file %s: %s", path, str(e))
+            os.remove(path)
+            audio = None
+
+        with self.lock:
+            if audio is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return audio
+
+    def put(self, key, audio):
+        """Store audio to the cache and remove least recently used files
+        if the size limit is exceeded.
+        """
+        path = self._get_file_path(key)
+
+        # Write to a temporary file first to prevent concurrent readers from
+        # reading a partially written file.
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        audio.export(tmp_path, format="wav")
+        os.replace(tmp_path, path)
+
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used files until the cache fits its size limit."""
+        with self.lock:
+            entries = []
+            for entry in os.scandir(self.path):
+                if entry.name.endswith(".wav"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                os.remove(path)
+                total_size -= size
+
+    def stats(self):
+        """Return cache hit and miss counters."""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _get_file_path(self, key):
+        return os.path.join(self.path, f"{key}.wav")
+
+
+def join_segments(segments):
+    """Concatenate a list of audio segments in a single copy. Repeatedly adding
+    AudioSegments together copies the growing result on every addition.
+    Args:
+        segments (list): list of pydub.AudioSegments
+    Return:
+        the joined pydub.AudioSegment
+    """
+    if not segments:
+        return pydub.AudioSegment.empty()
+
+    # Raw audio can only be joined when all segments share the same sample format
+    first = segments[0]
+    segments = [
+        segment.set_frame_rate(first.frame_rate).set_channels(first.channels).set_sample_width(first.sample_width)
+        for segment in segments
+    ]
+    return first._spawn(b"".join(segment.raw_data for segment in segments))
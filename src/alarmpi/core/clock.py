@@ -4,18 +4,27 @@
 import logging
 import signal
 import subprocess
+import threading
 from datetime import datetime, timedelta
 from functools import partial
 
 from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal
 from PyQt5.QtWidgets import QApplication
 
-from alarmpi.core import apconfig, alarm_builder, GUIWidgets
-from alarmpi.utils import rpi_utils, utils, debug_write
+from alarmpi.core import apaudio, apconfig, GUIWidgets
+from alarmpi.utils import rpi_utils, utils, debug_write, metrics, volume
 
 
 event_logger = logging.getLogger("eventLogger")
 
+# Seconds before the alarm to run each prebuild stage
+DEFAULT_PREBUILD_STAGES = {
+    "fetch": 1800,
+    "synthesize": 600,
+    "refresh": 60
+}
+PREBUILD_DEADLINE_MARGIN = 5  # seconds before the alarm the prebuild stages should finish
+
 
 class Clock:
     """Wrapper class for the clock itself. Defines interactions between
@@ -28,48 +37,25 @@ class Clock:
             config_file (str): path of the configuration file to use.
             kwargs: additional command line parameters passed via main.py
         """
-        # Read the alarm configuration file and initialize an AlarmBuilder object
+        # Read the alarm configuration file. The AlarmBuilder is created in setup()
+        # to show the clock before importing the audio and network libraries.
         self.config = apconfig.AlarmConfig(config_file)
-        self.alarm_player = alarm_builder.AlarmBuilder(self.config)
 
         self.main_window = GUIWidgets.AlarmWindow()
         self.settings_window = GUIWidgets.SettingsWindow(self.config)
         self.media_window = GUIWidgets.MediaPlayerWindow()
 
-        # Connect slots for media player window 
-        self.media_window.button.clicked.connect(lambda event: self.alarm_player.media_play_thread.stop())
-        self.alarm_player.media_play_thread.play_started_signal.connect(self.display_media_window)
-        self.alarm_player.media_play_thread.play_finished_signal.connect(self.media_window.hide)
-
         self.radio = RadioStreamer(self.config["radio"])
 
-        # Setup a QThread and QTimers for building and playing the alarm
-        self.alarm_play_thread = AlarmWorker(self.alarm_player, task="play")
-        self.alarm_play_thread.play_finished_signal.connect(self.finish_playing_alarm)
-
+        # Setup QTimers for playing the alarm
         self.alarm_timer = QTimer(self.main_window)
         self.alarm_timer.setSingleShot(True)
         self.alarm_timer.timeout.connect(self.play_alarm)
 
-        self.alarm_build_thread = AlarmWorker(self.alarm_player, task="build")
-        self.alarm_build_thread.build_finished_signal.connect(
-            self.finish_building_alarm
-        )
-
-        self.alarm_build_timer = QTimer(self.main_window)
-        self.alarm_build_timer.setSingleShot(True)
-        self.alarm_build_timer.timeout.connect(self.build_alarm)
-
-        # ... one more worker thread for building and playing an alarm from end to end
-        self.build_and_play_thread = AlarmWorker(
-            self.alarm_player, task="build_and_play"
-        )
-        self.build_and_play_thread.build_finished_signal.connect(
-            self.finish_building_alarm
-        )
-        self.build_and_play_thread.play_finished_signal.connect(
-            self.finish_playing_alarm
-        )
+        # Timer for fading in the screen brightness before the alarm
+        self.sunrise_timer = QTimer(self.main_window)
+        self.sunrise_timer.setSingleShot(True)
+        self.sunrise_timer.timeout.connect(self.start_sunrise)
 
         # Set debug signal handlers for custom debug signal and keyboard event
         signal.signal(signal.SIGUSR1, partial(debug_write.signal_handler, self.config))
@@ -96,17 +82,21 @@ class Clock:
         """Setup various button handlers as well as weather and train data polling
         for the main windows side bar.
         """
+        self.setup_alarm_player()
         self.setup_button_handlers()
+        self.setup_metrics_server()
 
         # Enable various plugin pollers if enabled in the config.
         # Note: plugins defined as instance variables to prevent
         # their pollers from being garbage collected.
+        self.plugins = []
         if self.config["plugins"]["openweathermap.org"]["enabled"]:
             from alarmpi.plugins import weather
 
             self.weather_plugin = weather.WeatherPlugin(self)
             self.weather_plugin.create_widgets()
             self.weather_plugin.setup_polling()
+            self.plugins.append(self.weather_plugin)
 
         if self.config["plugins"]["HSL"]["enabled"]:
             from alarmpi.plugins import trains
@@ -114,6 +104,7 @@ class Clock:
             self.train_plugin = trains.TrainPlugin(self)
             self.train_plugin.create_widgets()
             self.train_plugin.setup_polling()
+            self.plugins.append(self.train_plugin)
 
         if self.config["plugins"]["DHT22"]["enabled"]:
             from alarmpi.plugins import dht22
@@ -121,6 +112,7 @@ class Clock:
             self.dht22_plugin = dht22.DHT22Plugin(self)
             self.dht22_plugin.create_widgets()
             self.dht22_plugin.setup_polling()
+            self.plugins.append(self.dht22_plugin)
 
         # Set a higher row streches to the last used row to push elements
         # closer together
@@ -182,6 +174,60 @@ class Clock:
         default_station = self.config["radio"]["default"]
         self.settings_window.radio_station_combo_box.setCurrentText(default_station)
 
+    def setup_alarm_player(self):
+        """Create the AlarmBuilder and the worker threads for building and playing
+        the alarm. The alarm_builder module, along with pydub and requests, is only
+        imported here.
+        """
+        from alarmpi.core import alarm_builder
+
+        self.alarm_player = alarm_builder.AlarmBuilder(self.config)
+
+        # Play Now uses a builder of its own to not interfere with the prebuilt alarm
+        self.play_now_builder = alarm_builder.AlarmBuilder(self.config)
+
+        # Connect slots for media player window
+        self.media_window.button.clicked.connect(lambda event: self.alarm_player.media_play_thread.stop())
+        for builder in (self.alarm_player, self.play_now_builder):
+            builder.media_play_thread.play_started_signal.connect(self.display_media_window)
+            builder.media_play_thread.play_finished_signal.connect(self.media_window.hide)
+
+        # Setup QThreads for building and playing the alarm
+        self.alarm_play_thread = AlarmWorker(self.alarm_player, task="play")
+        self.alarm_play_thread.play_finished_signal.connect(self.finish_playing_alarm)
+
+        self.prebuild_scheduler = PrebuildScheduler(self.alarm_player, self.main_window)
+        self.prebuild_scheduler.worker.started.connect(self.main_window.waiting_spinner.start)
+        self.prebuild_scheduler.worker.finished.connect(self.finish_building_alarm)
+
+        # ... one more worker thread for building and playing an alarm from end to end
+        self.build_and_play_thread = AlarmWorker(
+            self.play_now_builder, task="build_and_play"
+        )
+        self.build_and_play_thread.build_finished_signal.connect(
+            self.finish_building_alarm
+        )
+        self.build_and_play_thread.play_finished_signal.connect(
+            self.finish_playing_alarm
+        )
+
+    def setup_metrics_server(self):
+        """Serve alarm build and plugin fetch metrics from a local endpoint if enabled."""
+        self.metrics_server = None
+        metrics_config = self.config.config.get("metrics", {})
+        if not metrics_config.get("enabled"):
+            return
+
+        try:
+            self.metrics_server = metrics.MetricsServer(
+                metrics.metrics, port=metrics_config.get("port", metrics.DEFAULT_PORT)
+            )
+        except OSError as e:
+            event_logger.error("Couldn't start metrics server: %s", str(e))
+            return
+
+        self.metrics_server.start()
+
     def setup_button_handlers(self):
         """Setup button handlers for the main window and settings window."""
         # Setup references to main control buttons in both windows
@@ -250,18 +296,17 @@ class Clock:
             )
         )
 
+        self.volume = volume.VolumeController(self.config["alsa"]["card"])
         self.settings_window.volume_slider.valueChanged.connect(self.set_volume)
         # Set initial handle position and icon. Disable the slider if
         # couldn't get a meaningful volume level (ie. invalid card in configuration)
-        try:
-            volume_level = utils.get_volume(self.config["alsa"]["card"])
-            self.set_volume(volume_level)
+        volume_level = self.volume.get_volume()
+        if volume_level is not None:
             self.settings_window.volume_slider.setValue(volume_level)
-        except AttributeError as e:
+            self.update_volume_icon(volume_level)
+        else:
             self.settings_window.volume_slider.setEnabled(False)
-            self.set_volume(
-                0
-            )  # Sets icon to muted (as well as attempting to set PCM control to selected card)
+            self.update_volume_icon(0)
             event_logger.warning(
                 "Couldn't get volume level. Wrong card value in configuration? Disabling volume slider."
             )
@@ -287,6 +332,7 @@ class Clock:
         # Get screen state before the event occured and set it as enabled.
         event_logger.debug("Activating display")
         old_screen_state = rpi_utils.get_and_set_screen_state("on")
+        self.main_window.resume_clock()
         self.show_control_buttons()
 
         alarm_time = self.get_current_active_alarm()
@@ -319,17 +365,15 @@ class Clock:
             event_logger.info("Setting alarm for %s", time_str)
             self.alarm_timer.start(alarm_wait_ms)
 
-            # Setup alarm build time for 5 minutes earlier (given large enough timer)
-            ALARM_BUILD_DELTA = 5 * 60 * 1000
-            alarm_build_wait_ms = max(
-                (0, alarm_wait_ms - ALARM_BUILD_DELTA)
-            )  # 0 if not enough time
+            # Schedule the alarm prebuild stages ahead of the alarm
+            lead_times = dict(DEFAULT_PREBUILD_STAGES)
+            lead_times.update(self.config["main"].get("build", {}).get("stages", {}))
+            next_alarm_dt = datetime.now() + timedelta(milliseconds=alarm_wait_ms)
+            self.prebuild_scheduler.schedule(next_alarm_dt, lead_times)
 
-            alarm_build_dt = self.alarm_dt - timedelta(minutes=5)
-            event_logger.info(
-                "Setting alarm build for %s", alarm_build_dt.strftime("%H:%M")
-            )
-            self.alarm_build_timer.start(alarm_build_wait_ms)
+            sunrise_ms = self.config["main"].get("sunrise", 0) * 1000
+            if sunrise_ms:
+                self.sunrise_timer.start(max(alarm_wait_ms - sunrise_ms, 0))
 
             # Set screen brightness to low if nighttime and nigthmode enabled
             if self._nightmode_active():
@@ -341,7 +385,10 @@ class Clock:
         alarm related labels.
         """
         self.alarm_timer.stop()
-        self.alarm_build_timer.stop()
+        self.prebuild_scheduler.stop()
+        self.sunrise_timer.stop()
+        # Stop a sunrise already raising the brightness
+        rpi_utils.backlight.cancel_ramp()
         event_logger.info("Alarm cleared")
         self.settings_window.clear_alarm()
         self.main_window.alarm_time_lcd.display("")
@@ -403,6 +450,14 @@ class Clock:
 
         self.alarm_play_thread.start()
 
+    def start_sunrise(self):
+        """Sunrise timer callback: turn the screen on and gradually raise its
+        brightness to full by the time the alarm plays.
+        """
+        event_logger.info("Starting sunrise")
+        self.set_screen_state("on")
+        rpi_utils.backlight.ramp_brightness(rpi_utils.HIGH_BRIGHTNESS, self.config["main"]["sunrise"])
+
     def finish_playing_alarm(self):
         """Slot for finishing alarm play: re-enable the play button
         and, if enabled, starts a separated cvlc process for the radio stream.
@@ -417,13 +472,6 @@ class Clock:
             url = self.radio_streams[default_station]
             self.play_radio(url=url)
 
-    def build_alarm(self):
-        """Alarm build timer callback: start building an alarm and display
-        loader icon.
-        """
-        self.main_window.waiting_spinner.start()
-        self.alarm_build_thread.start()
-
     def finish_building_alarm(self):
         """Slot for finishing alarm build: stop the loading icon."""
         self.main_window.waiting_spinner.stop()
@@ -464,15 +512,27 @@ class Clock:
         them when the screen in blank.
         """
         event_logger.debug("Blanking display")
-        rpi_utils.toggle_screen_state("off")
+        self.set_screen_state("off")
         self.hide_control_buttons()
 
     def enable_screen_and_show_control_buttons(self):
         """Turn on display backlight power and show the main window's control buttons."""
         event_logger.debug("Activating display")
-        rpi_utils.toggle_screen_state("on")
+        self.set_screen_state("on")
         self.show_control_buttons()
 
+    def set_screen_state(self, state):
+        """Turn display backlight power on/off. The main window clock is not updated
+        while the screen is off.
+        Args:
+            state (str): on/off
+        """
+        rpi_utils.toggle_screen_state(state)
+        if state == "off" and rpi_utils.IS_RASPBERRY_PI:
+            self.main_window.pause_clock()
+        else:
+            self.main_window.resume_clock()
+
     def hide_control_buttons(self):
         """Hide main window's bottom row buttons."""
         self.settings_button.hide()
@@ -489,12 +549,14 @@ class Clock:
 
     def set_volume(self, value):
         """Slider callback - set system volume level to match volume slider lever and
-        update volume level icon.
+        update volume level icon. Volume writes during a slider drag are merged
+        by the volume controller.
         """
-        utils.set_volume(
-            self.config["alsa"]["card"], value
-        )  # Sets the actual volume level
+        self.volume.set_volume(value)
+        self.update_volume_icon(value)
 
+    def update_volume_icon(self, value):
+        """Set the volume level icon matching a volume level."""
         if value == 0:
             mode = "muted"
         elif value <= 25:
@@ -513,10 +575,20 @@ class Clock:
         """
         self.radio.stop()
         self.alarm_player.media_play_thread.stop()
+        apaudio.player.close()
+        self.volume.flush()
+
+        # Wait for any running plugin fetches
+        for plugin in self.plugins:
+            plugin.shutdown()
+
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
 
         # Ensure display is on and at full brightness
         rpi_utils.toggle_screen_state("on")
         rpi_utils.set_display_backlight_brightness(rpi_utils.HIGH_BRIGHTNESS)
+        rpi_utils.backlight.close()
         QApplication.instance().quit()
 
     def _nightmode_active(self):
@@ -569,6 +641,7 @@ class AlarmWorker(QThread):
         super().__init__()
         self.alarm_builder = builder
         self.task = task
+        self.deadline = None  # time by which a prebuild stage should finish
 
     def _build(self):
         """Build and alarm."""
@@ -576,33 +649,133 @@ class AlarmWorker(QThread):
         self.alarm_builder.build()
 
     def _play(self):
-        """Play an existing alarm."""
+        """Play an existing alarm. A prebuild stage running late is not waited for."""
         if self.alarm_builder.config._get_debug_option("DO_NOT_PLAY_ALARM"):
             return
 
         self.alarm_builder.play()
 
+    def _build_and_stream(self):
+        """Build and play an alarm, starting playback as soon as the first section
+        is synthesized.
+        """
+        if self.alarm_builder.config._get_debug_option("DO_NOT_PLAY_ALARM"):
+            self._build()
+            self.build_finished_signal.emit(1)
+            return
+
+        event_logger.info("Building and streaming alarm")
+        first_audio = threading.Event()
+
+        def on_first_audio():
+            first_audio.set()
+            self.build_finished_signal.emit(1)
+
+        # Announce the current time in the greeting
+        alarm_time = datetime.now().strftime("%H:%M")
+        self.alarm_builder.build_and_stream(on_first_audio=on_first_audio, alarm_time=alarm_time)
+
+        # Ensure the loader icon is stopped even if nothing was played
+        if not first_audio.is_set():
+            self.build_finished_signal.emit(1)
+
+    def _run_prebuild_stage(self):
+        """Run an alarm prebuild stage. Errors are logged: a failed stage leaves
+        the results of any earlier stages in place.
+        """
+        event_logger.info("Running alarm prebuild stage: %s", self.task)
+        try:
+            getattr(self.alarm_builder, self.task)(deadline=self.deadline)
+        except Exception as e:
+            event_logger.error("Prebuild stage %s failed: %s", self.task, str(e))
+
     def run(self):
         if self.task == "build":
             self._build()
             self.build_finished_signal.emit(1)
+        elif self.task in PrebuildScheduler.STAGES:
+            self._run_prebuild_stage()
+            self.build_finished_signal.emit(1)
         elif self.task == "play":
             self._play()
             self.play_finished_signal.emit(1)
         elif self.task == "build_and_play":
-            # Temporarily overwrite alarm_time in config to pass correct value to the greeting
-            old = self.alarm_builder.config["main"]["alarm_time"]
-            self.alarm_builder.config["main"]["alarm_time"] = datetime.now().strftime(
-                "%H:%M"
-            )
-            self._build()
-            self.alarm_builder.config["main"]["alarm_time"] = old
-
-            self.build_finished_signal.emit(1)
-            self._play()
+            self._build_and_stream()
             self.play_finished_signal.emit(1)
 
 
+class PrebuildScheduler:
+    """Schedules the stages of building an alarm ahead of time:
+        fetch: fetch the alarm content
+        synthesize: synthesize the content and save the alarm to disk
+        refresh: refetch the content and re-synthesize only the changed sections
+    The stages run one at a time in a single worker thread. A stage becoming due
+    while another is running is run after it.
+    """
+    STAGES = ("fetch", "synthesize", "refresh")
+
+    def __init__(self, builder, parent):
+        """Args:
+            builder (alarm_builder.AlarmBuilder): the builder to run the stages with
+            parent (QWidget): parent for the stage timers
+        """
+        self.worker = AlarmWorker(builder, task=None)
+        self.worker.finished.connect(self._run_pending_stage)
+        self.pending_stage = None
+        self.alarm_dt = None
+
+        self.timers = {}
+        for stage in PrebuildScheduler.STAGES:
+            timer = QTimer(parent)
+            timer.setSingleShot(True)
+            timer.timeout.connect(partial(self.run_stage, stage))
+            self.timers[stage] = timer
+
+    def schedule(self, alarm_dt, lead_times):
+        """Start timers for each stage.
+        Args:
+            alarm_dt (datetime): time of the alarm
+            lead_times (dict): number of seconds before the alarm to run each stage
+        """
+        self.alarm_dt = alarm_dt
+        now = datetime.now()
+        for stage, timer in self.timers.items():
+            stage_dt = alarm_dt - timedelta(seconds=lead_times[stage])
+            wait_ms = max(0, int((stage_dt - now).total_seconds() * 1000))  # 0 if not enough time
+
+            event_logger.info("Setting alarm %s stage for %s", stage, max(stage_dt, now).strftime("%H:%M:%S"))
+            timer.start(wait_ms)
+
+    def stop(self):
+        """Stop all stage timers."""
+        for timer in self.timers.values():
+            timer.stop()
+        self.pending_stage = None
+
+    def is_active(self):
+        """Check whether any stage is scheduled."""
+        return any(timer.isActive() for timer in self.timers.values())
+
+    def run_stage(self, stage):
+        """Run a stage in the worker thread, or after the running stage finishes.
+        The stage should finish shortly before the alarm.
+        """
+        if self.worker.isRunning():
+            self.pending_stage = stage
+            return
+
+        self.worker.task = stage
+        if self.alarm_dt is not None:
+            self.worker.deadline = self.alarm_dt - timedelta(seconds=PREBUILD_DEADLINE_MARGIN)
+        self.worker.start()
+
+    def _run_pending_stage(self):
+        if self.pending_stage is not None:
+            stage = self.pending_stage
+            self.pending_stage = None
+            self.run_stage(stage)
+
+
 class RadioStreamer:
     """Helper class for playing a radio stream via cvlc."""
 
@@ -1,29 +1,88 @@
 import logging
+import threading
 
 import feedparser
+import requests
 
 from alarmpi.core import apcontent
+from alarmpi.utils import http_client
 
 
 event_logger = logging.getLogger("eventLogger")
 
+FEED_URL = "https://feeds.bbci.co.uk/news/world/rss.xml"
+NUMBER_OF_STORIES = 4
+
+# Validators and parsed stories of the latest feed response. Kept between builds to
+# send conditional requests and to skip parsing when the feed has not changed.
+_feed_cache = {"etag": None, "last_modified": None, "stories": None}
+_feed_cache_lock = threading.Lock()
+
 
 class NewsParser(apcontent.AlarmpiContent):
+    """Read the latest stories of the BBC News World section. Stories are shared through
+    the content cache, so repeated builds within the TTL, eg. Play Now right after a
+    prebuild, send no request.
+    """
+    CACHE_TTL = 300
 
     def __init__(self, section_data):
         super().__init__(section_data)
 
     def build(self):
-        url = "https://feeds.bbci.co.uk/news/world/rss.xml"
-        rss = feedparser.parse(url)
-
-        if rss.bozo or rss.status != 200:       # the bozo flag is set if connection failed or response wal not well-formed
+        stories = self.cached((), self.fetch_stories)
+        if stories is None:
             content = "Failed to reach BBC News"
 
         else:
             content = "And now, The latest stories from the World section of the BBC News.\n\n"
-            for entry in rss.entries[:4]:
+            for story in stories:
                 # append each item to the feed string
-                content += "{}.\n{}\n\n".format(entry["title"], entry["description"])
+                content += "{}.\n{}\n\n".format(story["title"], story["description"])
 
         self.content = content
+
+    def fetch_stories(self):
+        """Fetch the latest stories from the feed. A conditional request is sent with the
+        validators of the previous response; if the feed has not changed since,
+        the previously parsed stories are reused.
+        Return:
+            a list of dicts with the title and description of each story, or
+            None if the feed could not be read
+        """
+        with _feed_cache_lock:
+            headers = {}
+            if _feed_cache["etag"]:
+                headers["If-None-Match"] = _feed_cache["etag"]
+            if _feed_cache["last_modified"]:
+                headers["If-Modified-Since"] = _feed_cache["last_modified"]
+
+        try:
+            r = http_client.get(FEED_URL, headers=headers)
+        except requests.exceptions.RequestException as e:
+            event_logger.error(str(e))
+            return
+
+        if r.status_code == 304:
+            with _feed_cache_lock:
+                stories = _feed_cache["stories"]
+            if stories is not None:
+                event_logger.info("BBC News feed not modified, using previous stories")
+                return stories
+
+        rss = feedparser.parse(r.content)
+        if rss.bozo or r.status_code != 200:       # the bozo flag is set if response was not well-formed
+            return
+
+        stories = [
+            {"title": entry["title"], "description": entry["description"]}
+            for entry in rss.entries[:NUMBER_OF_STORIES]
+        ]
+        with _feed_cache_lock:
+            _feed_cache.update({
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "stories": stories
+            })
+
+        return stories
@@ -2,12 +2,12 @@ import subprocess
 import tempfile
 
 import pydub
-import pydub.playback
 
 from alarmpi.core import aptts
 
 
 class FestivalTTSManager(aptts.AlarmpiTTS):
+    voice = "default"
 
     def setup(self, text):
         """Convert text to audio using text2wave (part of festival package)."""
@@ -16,7 +16,7 @@ class FestivalTTSManager(aptts.AlarmpiTTS):
         # Use temporary file instead.
         # Maybe a difference in headers/metadata etc?
         with tempfile.NamedTemporaryFile() as f:
-            subprocess.run(["/usr/bin/text2wave", "-o", f.name], input=text.encode())
+            subprocess.run(["/usr/bin/text2wave", "-o", f.name], input=text.encode(), timeout=self.request_timeout())
             audio = pydub.AudioSegment.from_wav(f.name)
 
         return audio
@@ -1,5 +1,7 @@
+import datetime
 import io
 import logging
+import threading
 
 import pydub
 from google.cloud import texttospeech
@@ -7,10 +9,27 @@ from google.auth import impersonated_credentials
 import google.auth.transport.requests
 
 from alarmpi.core import aptts
+from alarmpi.utils import http_client
 
 
 event_logger = logging.getLogger("eventLogger")
 
+CREDENTIALS_LIFETIME = 600  # seconds
+CREDENTIALS_REFRESH_MARGIN = 180  # seconds
+REQUEST_TIMEOUT = 30  # seconds, for requests without a synthesizing deadline
+
+# API clients and their credentials shared between GoogleCloudTTS instances, keyed by
+# service account. This keeps the gRPC channel open between alarms and avoids
+# fetching new credentials for each build.
+_client_pool = {}
+_client_pool_lock = threading.Lock()
+_credentials_lock = threading.Lock()
+
+# Background threads fetching or refreshing credentials and timers starting the next
+# refresh, keyed by service account
+_refresh_threads = {}
+_refresh_timers = {}
+
 
 class GoogleCloudTTS(aptts.AlarmpiTTS):
     """A Google Cloud Text-to-Speech client. This uses a WaveNet voice for more human-like
@@ -21,27 +40,52 @@ class GoogleCloudTTS(aptts.AlarmpiTTS):
     https://cloud.google.com/text-to-speech/quotas
     https://cloud.google.com/text-to-speech/pricing
     """
+    voice = "en-US-Wavenet-C"
 
     def __init__(self, auth):
         super().__init__()
         self.auth = auth
-        self.client = self.get_client()
 
-    def get_client(self):
-        """Create an API client using the impersonated service account credentials."""
-        self.credentials = fetch_service_account_access_token(self.auth["service_account"])
-        client = texttospeech.TextToSpeechClient(credentials=self.credentials)
-        return client
+    @property
+    def client(self):
+        """The API client shared by instances using the same service account."""
+        return get_client(self.auth["service_account"])[0]
+
+    @property
+    def credentials(self):
+        """The impersonated service account credentials of the shared API client."""
+        return get_client(self.auth["service_account"])[1]
+
+    def prepare(self, until=None):
+        """Fetch the credentials, or refresh them if they are about to expire, in the background.
+        The credentials are refreshed in place, so the shared client picks up the new token.
+        Called by the prebuild fetch stage with the alarm deadline and before synthesizing.
+        Args:
+            until (datetime): optional time until which the credentials are kept fresh
+                by refreshing them again before they expire
+        """
+        start_refresh(self.auth["service_account"], until)
+
+    def wait_for_refresh(self):
+        """Wait for a background refresh of the credentials to finish, if one is running."""
+        with _client_pool_lock:
+            thread = _refresh_threads.get(self.auth["service_account"])
+
+        if thread is not None:
+            thread.join(self.request_timeout())
 
     def setup(self, text):
         """Create a TTS client and convert input to pydub audio."""
+        # Use the token from a refresh in progress instead of refreshing it again within the request
+        self.wait_for_refresh()
+
         # Set the text input to be synthesized
         synthesis_input = texttospeech.SynthesisInput(text=text)
 
         # Build the voice request and specify a WaveNet voice for more human like speech
         voice = texttospeech.VoiceSelectionParams(
             language_code="en-US",
-            name="en-US-Wavenet-C"
+            name=self.voice
         )
 
         # Select the type of audio file you want returned
@@ -51,7 +95,12 @@ class GoogleCloudTTS(aptts.AlarmpiTTS):
 
         # Perform the text-to-speech request on the text input with the selected
         # voice parameters and audio file type
-        response = self.client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
+        response = self.client.synthesize_speech(
+            input=synthesis_input,
+            voice=voice,
+            audio_config=audio_config,
+            timeout=self.request_timeout(default=REQUEST_TIMEOUT)
+        )
 
         f = io.BytesIO(response.audio_content)
         return pydub.AudioSegment.from_file(f, format="mp3")
@@ -78,11 +127,95 @@ def fetch_service_account_access_token(
         source_credentials=credentials,
         target_principal=impersonated_service_account,
         target_scopes=["https://www.googleapis.com/auth/cloud-platform"],
-        lifetime=600,
+        lifetime=CREDENTIALS_LIFETIME,
     )
 
     # Get the OAuth2 token.
-    request = google.auth.transport.requests.Request()
+    request = google.auth.transport.requests.Request(session=http_client.session)
     target_credentials.refresh(request)
 
     return target_credentials
+
+
+def get_client(service_account):
+    """Get the API client and credentials of a service account. Credentials are fetched
+    and the client created on first use.
+    Return:
+        a (texttospeech.TextToSpeechClient, impersonated_credentials.Credentials) tuple
+    """
+    with _client_pool_lock:
+        if service_account not in _client_pool:
+            credentials = fetch_service_account_access_token(service_account)
+            client = texttospeech.TextToSpeechClient(credentials=credentials)
+            _client_pool[service_account] = (client, credentials)
+
+        return _client_pool[service_account]
+
+
+def start_refresh(service_account, until=None):
+    """Start a background thread fetching or refreshing the credentials of a service
+    account unless one is already running.
+    Args:
+        service_account (str): the service account to refresh the credentials of
+        until (datetime): optional time until which the credentials are kept fresh
+    """
+    with _client_pool_lock:
+        thread = _refresh_threads.get(service_account)
+        if thread is not None and thread.is_alive():
+            return
+
+        thread = threading.Thread(target=refresh_client, args=(service_account, until), daemon=True)
+        _refresh_threads[service_account] = thread
+        thread.start()
+
+
+def refresh_client(service_account, until=None):
+    """Fetch or refresh the credentials of a service account. If they would expire before
+    until, schedule the next refresh for when they are about to expire.
+    """
+    try:
+        credentials = get_client(service_account)[1]
+        refresh_credentials(credentials)
+    except Exception as e:
+        event_logger.error("Failed to refresh credentials for %s: %s", service_account, str(e))
+        return
+
+    if until is None:
+        return
+
+    # google-auth stores expiry as a naive UTC datetime
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    refresh_in = (credentials.expiry - now).total_seconds() - CREDENTIALS_REFRESH_MARGIN + 1
+    if datetime.datetime.now() + datetime.timedelta(seconds=refresh_in) >= until:
+        return
+
+    with _client_pool_lock:
+        previous = _refresh_timers.get(service_account)
+        if previous is not None:
+            previous.cancel()
+
+        timer = threading.Timer(max(refresh_in, 0), start_refresh, args=(service_account, until))
+        timer.daemon = True
+        _refresh_timers[service_account] = timer
+        timer.start()
+
+
+def credentials_expiring(credentials):
+    """Check whether credentials expire within CREDENTIALS_REFRESH_MARGIN seconds."""
+    if credentials.expiry is None:
+        return True
+
+    # google-auth stores expiry as a naive UTC datetime
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return credentials.expiry - now < datetime.timedelta(seconds=CREDENTIALS_REFRESH_MARGIN)
+
+
+def refresh_credentials(credentials):
+    """Refresh the OAuth2 token of credentials unless another thread already did."""
+    with _credentials_lock:
+        if not credentials_expiring(credentials):
+            return
+
+        event_logger.info("Refreshing credentials for %s", credentials.service_account_email)
+        request = google.auth.transport.requests.Request(session=http_client.session)
+        credentials.refresh(request)
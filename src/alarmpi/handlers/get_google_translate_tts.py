@@ -1,11 +1,11 @@
 import textwrap
 import io
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
 import pydub
-import pydub.playback
 
 from alarmpi.core import aptts
+from alarmpi.utils import http_client
 
 
 class GoogleTranslateTTSManager(aptts.AlarmpiTTS):
@@ -14,28 +14,37 @@ class GoogleTranslateTTSManager(aptts.AlarmpiTTS):
     parameters are mostly gathered from various StackOverflow posts, such as
     https://stackoverflow.com/questions/35002003/how-to-use-google-translate-tts-with-the-new-v2-api
     """
+    URL = "https://translate.google.com/translate_tts"
+    voice = "en"
+    MAX_CONCURRENT_REQUESTS = 4
 
     def setup(self, text):
         """Send text to the translate_tts API and play results.
         The API only accepts 200 characters per requests.
-        Split the text to part, send request for each and play all results
-        after the requests to minimize processing delays.
+        Split the text to parts and send the requests concurrently over the shared
+        HTTP session. The decoded parts are joined once all requests have finished.
         """
-        url = "https://translate.google.com/translate_tts"
-
         parts = textwrap.wrap(text, 200)
-        audio = pydub.AudioSegment.empty()  # init an empty AudioSegment as base for appending other segments
-        for part in parts:
-            params = {
-                "tl": "en",
-                "client": "tw-ob",
-                "ie": "UTF-8",
-                "q": part
-            }
-            r = requests.get(url, params=params)
-            f = io.BytesIO(r.content)
-            audio_part = pydub.AudioSegment.from_file(f, format="mp3")
-            audio += audio_part
-
-        return audio
-
+        with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_REQUESTS) as executor:
+            # map preserves the order of the parts
+            audio_parts = list(executor.map(self.fetch_part, parts))
+
+        return aptts.join_segments(audio_parts)
+
+    def fetch_part(self, part):
+        """Synthesize a single part of at most 200 characters.
+        Args:
+            part (str): the text to synthesize
+        Return:
+            the part as pydub.AudioSegment
+        """
+        params = {
+            "tl": self.voice,
+            "client": "tw-ob",
+            "ie": "UTF-8",
+            "q": part
+        }
+        timeout = self.request_timeout(default=http_client.DEFAULT_TIMEOUT)
+        r = http_client.get(self.URL, params=params, timeout=timeout)
+        f = io.BytesIO(r.content)
+        return pydub.AudioSegment.from_file(f, format="mp3")
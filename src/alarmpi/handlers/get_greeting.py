@@ -8,8 +8,13 @@ from alarmpi.core import apcontent
 class Greeting(apcontent.AlarmpiContent):
     """Creates greeting messages based on current time of day."""
 
-    def __init__(self, alarm_config):
+    def __init__(self, alarm_config, alarm_time=None):
+        """Args:
+            alarm_config (AlarmConfig): the alarm configuration
+            alarm_time (str): time to announce in HH:MM, defaults to the configured alarm time
+        """
         self.config = alarm_config
+        self.alarm_time = alarm_time or alarm_config["main"]["alarm_time"]
         greeting_data = alarm_config["content"]["greeting"]
         super().__init__(greeting_data)
 
@@ -20,7 +25,7 @@ class Greeting(apcontent.AlarmpiContent):
         current_month = today.strftime("%B")
 
         # Convert 24 hour override format to 12 hour format
-        alarm_time = datetime.strptime(self.config["main"]["alarm_time"], "%H:%M").strftime("%I:%M %p") # eg. 6:36 pm
+        alarm_time = datetime.strptime(self.alarm_time, "%H:%M").strftime("%I:%M %p") # eg. 6:36 pm
 
         if today.hour < 12:
             period = "morning"
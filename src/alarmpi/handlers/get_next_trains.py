@@ -4,16 +4,32 @@
 # https://www.digitraffic.fi/rautatieliikenne/#liikennepaikan-saapuvat-ja-l%C3%A4htev%C3%A4t-junat-lukum%C3%A4%C3%A4r%C3%A4rajoitus
 
 import datetime
+import heapq
 import logging
 
 import requests
+import urllib3
 from dateutil import tz
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 from alarmpi.core import apcontent
+from alarmpi.utils import http_client
 
 
 event_logger = logging.getLogger("eventLogger")
 
+TZ_UTC = tz.tzutc()
+TZ_LOCAL = tz.tzlocal()
+
+# Errors raised while a response body is read and parsed. JSON errors of both requests
+# and ijson are ValueErrors. A streamed body is read from urllib3 directly, so its
+# network errors are not wrapped by requests.
+RESPONSE_ERRORS = (ValueError, requests.exceptions.RequestException, urllib3.exceptions.HTTPError)
+
 
 # While this feature is not part of the alarm, subclassing AlarmpiContent provides
 # access to the config.
@@ -21,60 +37,82 @@ class TrainParser(apcontent.AlarmpiContent):
 
     def run(self):
         """Run the parser: fetch and format a list of next departures. Return
-        None if API call fails.
+        a dict with an error if the API call fails.
         """
-        api_response = self.fetch_daily_train_data()
-        if "error" in api_response:
-            return api_response
+        # A streamed response is read and parsed only as the trains are formatted
+        try:
+            api_response = self.fetch_daily_train_data()
+            if isinstance(api_response, dict) and "error" in api_response:
+                return api_response
 
-        return self.format_next_departures(api_response)
+            return self.format_next_departures(api_response)
+        except RESPONSE_ERRORS as e:
+            event_logger.error("Failed to read train data: %s", str(e))
+            return {"error": {"message": str(e), "status_code": 503}}
 
     def format_next_departures(self, api_response):
         """Format a list of API response departures to a list of dicts
         to pass back to clock.py.
+        Args:
+            api_response (iterable): the API response trains, either a list or
+                an iterator of trains parsed from a stream
         """
         locals_ = self.filter_commuter_trains(api_response)
 
         departure_rows = []
         for train in locals_:
-            row = self.get_local_departure_row(train)
-
-            # Ignore already departed trains
-            if "actualTime" in row:
-                continue
-
-            # Determine the timestamp key to be used for sorting:
-            # if an estimate exists, use it, otherwise use scheduled departure time
-            sort_key = "scheduledTime"
-            scheduled_time_dt = self.utc_timestamp_to_local_datetime(row["scheduledTime"])
-            live_estimate_time_dt = None
-            if "liveEstimateTime" in row:
-                # Check that liveEstimateTime differs from scheduledTime by at least 1 minute
-                live_estimate_time_dt = self.utc_timestamp_to_local_datetime(
-                    row["liveEstimateTime"])
-                td = live_estimate_time_dt - scheduled_time_dt
-                sort_key = "liveEstimateTime"
-
-                if abs(td.seconds) < 60:
-                    live_estimate_time_dt = None
-
-            sort_dt = self.utc_timestamp_to_local_datetime(row[sort_key])
-            departure_rows.append({
-                "liveEstimateTime": live_estimate_time_dt,
-                "scheduledTime": scheduled_time_dt,
-                "commuterLineID": train["commuterLineID"],
-                "cancelled": train["cancelled"],
-                "sortKey": sort_dt
-            })
-
-        departure_rows.sort(key=lambda row: row["sortKey"])
+            departure = self.format_departure(train)
+            if departure is not None:
+                departure_rows.append(departure)
 
         # Limit trains to return to the count in the config
         MAX_NUMBER_OF_TRAINS = self.section_data["trains"]
-        return departure_rows[:MAX_NUMBER_OF_TRAINS]
+        return heapq.nsmallest(MAX_NUMBER_OF_TRAINS, departure_rows, key=lambda row: row["sortKey"])
+
+    def format_departure(self, train):
+        """Format a single API response train to a departure dict.
+        Args:
+            train (dict): a single train object from an API response
+        Return:
+            the departure as a dict, or None if the train has already departed or
+            does not depart from the station
+        """
+        row = self.get_local_departure_row(train)
+
+        # Ignore already departed trains and trains not departing from the station
+        if row is None or "actualTime" in row:
+            return None
+
+        # Determine the timestamp to be used for sorting:
+        # if an estimate exists, use it, otherwise use scheduled departure time
+        scheduled_time_dt = self.utc_timestamp_to_local_datetime(row["scheduledTime"])
+        sort_dt = scheduled_time_dt
+        live_estimate_time_dt = None
+        if "liveEstimateTime" in row:
+            # Check that liveEstimateTime differs from scheduledTime by at least 1 minute
+            live_estimate_time_dt = self.utc_timestamp_to_local_datetime(
+                row["liveEstimateTime"])
+            td = live_estimate_time_dt - scheduled_time_dt
+            sort_dt = live_estimate_time_dt
+
+            if abs(td.seconds) < 60:
+                live_estimate_time_dt = None
+
+        return {
+            "liveEstimateTime": live_estimate_time_dt,
+            "scheduledTime": scheduled_time_dt,
+            "commuterLineID": train["commuterLineID"],
+            "cancelled": train["cancelled"],
+            "sortKey": sort_dt
+        }
 
     def fetch_daily_train_data(self):
-        """API call to get the next local arrivivals."""
+        """API call to get the next local arrivivals. If ijson is installed the
+        response is parsed as a stream, one train at a time, instead of loading
+        the whole response.
+        Return:
+            an iterable of API response trains, or a dict with an error
+        """
         URL = f"https://rata.digitraffic.fi/api/v1/live-trains/station/{self.section_data['station_code']}"
         params = {
             "arrived_trains": 1,  # API minimum
@@ -84,7 +122,7 @@ class TrainParser(apcontent.AlarmpiContent):
 
         # Catch any network related errors from the request itself
         try:
-            r = requests.get(URL, params=params)
+            r = http_client.get(URL, params=params, stream=ijson is not None)
         except Exception as e:
             event_logger.error(str(e))
             return {"error": {"message": str(e), "status_code": 503}}
@@ -93,8 +131,23 @@ class TrainParser(apcontent.AlarmpiContent):
         if r.status_code != 200:
             return {"error": {"message": r.text, "status_code": r.status_code}}
 
+        if ijson is not None:
+            return TrainParser.iter_streamed_trains(r)
+
         return r.json()
 
+    @staticmethod
+    def iter_streamed_trains(r):
+        """Parse trains from a streamed API response one at a time. The response is closed,
+        releasing its pooled connection, once read or if reading it fails.
+        Args:
+            r (requests.Response): a response requested with stream=True
+        """
+        with r:
+            # Let urllib3 decompress a gzipped response body
+            r.raw.decode_content = True
+            yield from ijson.items(r.raw, "item")
+
     def filter_commuter_trains(self, response):
         """Filter a list of API response trains to commuter trains heading towards Helsinki.
         Args:
@@ -102,27 +155,33 @@ class TrainParser(apcontent.AlarmpiContent):
         Return:
             list of filtered trains
         """
-        filtered = [train for train in response if
-                    train["timetableType"] == "REGULAR" and
-                    train["trainCategory"] == "Commuter" and
-                    train["timeTableRows"][-1]["stationShortCode"] == "HKI"
-                    ]
+        return [train for train in response if self.is_commuter_train(train)]
 
-        return filtered
+    def is_commuter_train(self, train):
+        """Check whether an API response train is a regular commuter train heading
+        towards Helsinki.
+        """
+        return (
+            train["timetableType"] == "REGULAR" and
+            train["trainCategory"] == "Commuter" and
+            train["timeTableRows"][-1]["stationShortCode"] == "HKI"
+        )
 
     def get_local_departure_row(self, train):
         """Given an API response train, return the DEPARTURE row of its timeTableRows
         Args:
             train (dict): a single train object from an API response
         Return:
-            the local departure row of the train's timeTableRows
+            the local departure row of the train's timeTableRows, or None if the
+            train does not depart from the station
         """
-        rows = [row for row in train["timeTableRows"] if
-                row["type"] == "DEPARTURE" and
-                row["stationShortCode"] == self.section_data["station_code"]
-                ]
-
-        return rows[0]
+        station_code = self.section_data["station_code"]
+        return next(
+            (row for row in train["timeTableRows"] if
+             row["type"] == "DEPARTURE" and
+             row["stationShortCode"] == station_code),
+            None
+        )
 
     def timestamp_to_datetime(self, s):
         """Convert a timestamp to a Python datetime.
@@ -131,7 +190,7 @@ class TrainParser(apcontent.AlarmpiContent):
         Returns:
             a datetime.datetime instance
         """
-        return datetime.datetime.strptime(s, "%Y-%m-%dT%H:%M:%S.000Z")
+        return datetime.datetime.fromisoformat(s.rstrip("Z"))
 
     def utc_timestamp_to_local_datetime(self, s):
         """Convert a timestamp str in UTC as returned by the API to a datetime
@@ -141,23 +200,19 @@ class TrainParser(apcontent.AlarmpiContent):
         Returns:
             a datetime.datetime instance
         """
-        tz_utc = tz.tzutc()
-        tz_local = tz.tzlocal()
-
-        utc = datetime.datetime.strptime(s, "%Y-%m-%dT%H:%M:%S.000Z")
+        utc = datetime.datetime.fromisoformat(s.rstrip("Z"))
 
         # Tell the datetime object that it's in UTC time zone since
         # datetime objects are 'naive' by default
-        utc = utc.replace(tzinfo=tz_utc)
+        utc = utc.replace(tzinfo=TZ_UTC)
 
-        return utc.astimezone(tz_local)
+        return utc.astimezone(TZ_LOCAL)
 
     def msecs_until_datetime(self, d):
         """Compute the number of milliseconds until input datetime. Input is
         assumed to be a local, future timestamp as a timezone aware datetime instance.
         """
-        tz_local = tz.tzlocal()
-        now = datetime.datetime.now(tz=tz_local)
+        now = datetime.datetime.now(tz=TZ_LOCAL)
 
         if d <= now:
             return 0
@@ -0,0 +1,152 @@
+# Push based train updates from the DigiTraffic MQTT feed. Updated trains are
+# published on a per station topic as the same train objects returned by the
+# live-trains API; they are merged to an in-memory departures table.
+# https://www.digitraffic.fi/en/railway-traffic/#mqtt-api
+
+import datetime
+import heapq
+import json
+import logging
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:
+    mqtt = None
+
+from alarmpi.handlers import get_next_trains
+
+
+event_logger = logging.getLogger("eventLogger")
+
+
+MQTT_HOST = "rata.digitraffic.fi"
+MQTT_PORT = 443
+MQTT_PATH = "/mqtt"
+STATION_TOPIC = "trains-by-station/{station_code}"
+
+# Departures are kept this long past their departure time in case the departure
+# update is missed
+DEPARTED_GRACE_PERIOD = datetime.timedelta(minutes=2)
+
+
+class DeparturesTable:
+    """Next departures from a station, keyed by train and updated one train at a time."""
+
+    def __init__(self, parser):
+        """Args:
+            parser (get_next_trains.TrainParser): parser for formatting trains
+        """
+        self.parser = parser
+        self.departures = {}
+
+    def update(self, train):
+        """Merge an updated train to the table.
+        Args:
+            train (dict): a single train object from the API
+        Return:
+            True if the table changed
+        """
+        key = (train["departureDate"], train["trainNumber"])
+        departure = None
+        if self.parser.is_commuter_train(train):
+            departure = self.parser.format_departure(train)
+
+        if departure is None:
+            return self.departures.pop(key, None) is not None
+
+        if self.departures.get(key) == departure:
+            return False
+
+        self.departures[key] = departure
+        return True
+
+    def reset(self, trains):
+        """Replace the table with a full list of trains.
+        Args:
+            trains (iterable): train objects from the live-trains API
+        """
+        self.departures.clear()
+        for train in trains:
+            self.update(train)
+
+    def next_departures(self, count):
+        """Return the next departures sorted by their estimated departure time.
+        Args:
+            count (int): maximum number of departures to return
+        """
+        now = datetime.datetime.now(tz=get_next_trains.TZ_LOCAL)
+        for key, departure in list(self.departures.items()):
+            if departure["sortKey"] < now - DEPARTED_GRACE_PERIOD:
+                del self.departures[key]
+
+        return heapq.nsmallest(count, self.departures.values(), key=lambda row: row["sortKey"])
+
+
+class TrainUpdateListener:
+    """Subscribe to the train updates of a station. Messages are received in the MQTT
+    client's network thread.
+    """
+
+    def __init__(self, station_code, on_train, on_connect=None, client=None):
+        """Args:
+            station_code (str): the station to receive train updates for
+            on_train (callable): called with each updated train object
+            on_connect (callable): optional callback called on each (re)connect
+            client (paho.mqtt.client.Client): MQTT client to use, defaults to a
+                client connecting to DigiTraffic over secure websockets
+        """
+        self.topic = STATION_TOPIC.format(station_code=station_code)
+        self.on_train = on_train
+        self.on_connect = on_connect
+
+        if client is None:
+            client = TrainUpdateListener.create_client()
+        self.client = client
+        self.client.on_connect = self._handle_connect
+        self.client.on_message = self._handle_message
+
+    @staticmethod
+    def create_client():
+        """Create an MQTT client for the DigiTraffic websocket endpoint."""
+        if mqtt is None:
+            raise RuntimeError("Push updates require the paho-mqtt package")
+
+        # paho-mqtt 2.x requires selecting the callback API version
+        try:
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, transport="websockets")
+        except AttributeError:
+            client = mqtt.Client(transport="websockets")
+
+        client.ws_set_options(path=MQTT_PATH)
+        client.tls_set()
+        return client
+
+    def start(self, host=MQTT_HOST, port=MQTT_PORT):
+        """Connect to the broker and start receiving updates in a background thread.
+        The client reconnects automatically if the connection is lost.
+        """
+        self.client.connect_async(host, port)
+        self.client.loop_start()
+
+    def stop(self):
+        """Disconnect and stop the background thread."""
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def _handle_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            event_logger.error("Train update connection failed: %s", rc)
+            return
+
+        client.subscribe(self.topic)
+        if self.on_connect:
+            self.on_connect()
+
+    def _handle_message(self, client, userdata, message):
+        try:
+            train = json.loads(message.payload)
+        except ValueError as e:
+            event_logger.error("Invalid train update: %s", str(e))
+            return
+
+        self.on_train(train)
@@ -4,20 +4,38 @@
 
 import datetime
 import logging
+import os
+import tempfile
 
 import requests
-from requests.exceptions import RequestException
 
 from alarmpi.core import apcontent
+from alarmpi.utils import http_client, utils
 
 
 event_logger = logging.getLogger("eventLogger")
 
+# Weather icons are cached on disk by their id, see
+# https://openweathermap.org/weather-conditions#Icon-list
+ICON_CACHE_DIR = os.path.join(utils.CACHE_DIR, "weather_icons")
+ICON_IDS = [
+    f"{code}{period}"
+    for code in ["01", "02", "03", "04", "09", "10", "11", "13", "50"]
+    for period in ["d", "n"]
+]
+
 
 class OpenWeatherMapClient(apcontent.AlarmpiContent):
     """Fetch waether predictions from openweathermap.org
     https://openweathermap.org/api
+    Responses are shared between the alarm and the weather plugin through the content
+    cache. The alarm uses a cached response up to the plugin's default refresh interval
+    past its TTL, refreshing it in the background for later prebuild stages. Should a
+    request fail, the alarm uses a cached response up to an hour past its TTL.
     """
+    CACHE_TTL = 600
+    CACHE_MAX_STALE = 1800
+    CACHE_STALE_IF_ERROR = 3600
 
     def __init__(self, section_data):
         super().__init__(section_data)
@@ -28,7 +46,7 @@ class OpenWeatherMapClient(apcontent.AlarmpiContent):
             self.credentials = f.read().strip()
 
     def build(self):
-        api_response = self.get_weather()
+        api_response = self.get_weather(max_stale=self.CACHE_MAX_STALE, stale_if_error=self.CACHE_STALE_IF_ERROR)
         if "error" in api_response:
             self.content = "Failed to read openweathermap.org. "
             return
@@ -87,7 +105,17 @@ class OpenWeatherMapClient(apcontent.AlarmpiContent):
 
         self.content = weather_string
 
-    def get_weather(self):
+    def get_weather(self, max_stale=0, stale_if_error=0):
+        """Get current weather data through the content cache.
+        Args:
+            max_stale (int): number of seconds past the TTL a cached response may be
+                returned while it is refreshed in the background
+            stale_if_error (int): number of seconds past the TTL a cached response may be
+                returned if the request fails
+        """
+        return self.cached((self.city_id,), self.request_weather, max_stale, stale_if_error)
+
+    def request_weather(self):
         """API request to fetch current weather data."""
         URL = "http://api.openweathermap.org/data/2.5/weather"
         params = {
@@ -98,7 +126,7 @@ class OpenWeatherMapClient(apcontent.AlarmpiContent):
 
         # Catch any network related errors from the request itself
         try:
-            r = requests.get(URL, params=params)
+            r = http_client.get(URL, params=params)
         except Exception as e:
             event_logger.error(str(e))
             return {"error": {"message": str(e), "status_code": 503}}
@@ -129,7 +157,8 @@ class OpenWeatherMapClient(apcontent.AlarmpiContent):
 
         sunrise = OpenWeatherMapClient.timesamp_to_time_str(response["sys"]["sunrise"])
         sunset = OpenWeatherMapClient.timesamp_to_time_str(response["sys"]["sunset"])
-        icon = OpenWeatherMapClient.get_weather_icon(response["weather"][0]["icon"])
+        icon_id = response["weather"][0]["icon"]
+        icon = OpenWeatherMapClient.get_weather_icon(icon_id)
 
         return {
             "temp": today_temp,
@@ -139,22 +168,53 @@ class OpenWeatherMapClient(apcontent.AlarmpiContent):
             "wind_chill": wind_chill,
             "sunrise": sunrise,
             "sunset": sunset,
-            "icon": icon
+            "icon": icon,
+            "icon_id": icon_id
         }
 
     @staticmethod
     def get_weather_icon(icon_id):
-        """Get weather icon matching an id from the response.
+        """Get weather icon matching an id from the response. Icons are read from
+        the disk cache if available, otherwise they are fetched and cached.
         https://openweathermap.org/weather-conditions
         """
+        path = os.path.join(ICON_CACHE_DIR, f"{icon_id}.png")
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+
         try:
             url = "http://openweathermap.org/img/wn/{}@2x.png".format(icon_id)
-            r = requests.get(url)
-            return r.content  # binary content
+            r = http_client.get(url)
         except requests.exceptions.RequestException as e:
             event_logger.error(str(e))
             return
 
+        if r.status_code != 200:
+            event_logger.error("Failed to fetch weather icon %s: %s", icon_id, r.status_code)
+            return
+
+        # Write to a temporary file of its own first to prevent concurrent readers from
+        # reading a partially written icon and concurrent writers from truncating it.
+        # The icon is returned even if it cannot be cached.
+        try:
+            os.makedirs(ICON_CACHE_DIR, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=ICON_CACHE_DIR, suffix=".tmp", delete=False) as f:
+                f.write(r.content)
+            os.replace(f.name, path)
+        except OSError as e:
+            event_logger.warning("Failed to cache weather icon %s: %s", icon_id, str(e))
+
+        return r.content  # binary content
+
+    @staticmethod
+    def prefetch_weather_icons():
+        """Fetch all weather icons missing from the disk cache."""
+        for icon_id in ICON_IDS:
+            OpenWeatherMapClient.get_weather_icon(icon_id)
+
     @staticmethod
     def ms_to_kmh(wind_speed):
         """Convert wind speed measure from meters/second to kilometres/hour."""
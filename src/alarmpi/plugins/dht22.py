@@ -1,15 +1,17 @@
+from functools import partial
 from PyQt5.QtWidgets import QLabel
 from PyQt5.QtCore import QTimer, Qt
 
 from alarmpi.handlers import get_dht22_readings
+from alarmpi.core import applugin
 
 
-class DHT22Plugin:
+class DHT22Plugin(applugin.AlarmpiPlugin):
 
     def __init__(self, parent):
-        self.parent = parent
         self.config_data = parent.config["plugins"]["DHT22"]
         self.client = get_dht22_readings.DHT22Client(self.config_data)
+        super().__init__(parent)
 
     def create_widgets(self):
         """Create and set QLabel for displaying temperature."""
@@ -25,14 +27,23 @@ class DHT22Plugin:
         _timer.start(refresh_interval_msec)
 
     def update_temperature(self):
-        """Fetch new temperature readings from the handler."""
-        temperature = self.client.try_get_temperature()
+        """Start reading the sensor in a background thread. The result is displayed
+        by display_temperature. A timed out read is handled as a failed read.
+        """
+        self.start_fetch(
+            self.client.try_get_temperature,
+            self.display_temperature,
+            on_timeout=partial(self.display_temperature, None)
+        )
+
+    def display_temperature(self, temperature):
+        """Display a temperature reading."""
 
         # If initial call fails, display an error message.
         # Otherwise do not set message on failed calls.
-        if temperature is None and not self.dht22_label.text():
-            self.dht22_label.setText("ERR")
+        if temperature is None and not self.view.get(self.dht22_label):
+            self.view.set_text(self.dht22_label, "ERR")
 
         elif temperature:
             msg = f"⌂ {round(temperature)}°C"
-            self.dht22_label.setText(msg)
+            self.view.set_text(self.dht22_label, msg)
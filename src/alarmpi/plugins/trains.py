@@ -1,16 +1,27 @@
 from functools import partial
 from PyQt5.QtWidgets import QLabel
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
 
-from alarmpi.handlers import get_next_trains
+from alarmpi.handlers import get_next_trains, get_train_updates
 from alarmpi.core import applugin
 
 
+# Number of seconds between redraws of pushed departures: departed trains are
+# removed and a failed fetch is retried even when no updates arrive
+PUSH_REDRAW_INTERVAL = 60
+
+class TrainUpdateSignals(QObject):
+    """Signals passing pushed train updates from the MQTT thread to the GUI thread."""
+    train_signal = pyqtSignal(object)
+    connected_signal = pyqtSignal()
+
+
 class TrainPlugin(applugin.AlarmpiPlugin):
 
     def __init__(self, parent):
         self.config_data = parent.config["plugins"]["HSL"]
         self.parser = get_next_trains.TrainParser(self.config_data)
+        self.listener = None
         super().__init__(parent)
 
     def create_widgets(self):
@@ -28,7 +39,16 @@ class TrainPlugin(applugin.AlarmpiPlugin):
         self.parent.main_window.left_plugin_grid.addWidget(self.error_label)
         
     def setup_polling(self):
-        """Setup polling for next train departure."""
+        """Setup polling for next train departure. In push mode train updates are
+        received from DigiTraffic as they happen instead.
+        """
+        if self.config_data.get("push"):
+            try:
+                self.setup_push_updates()
+                return
+            except RuntimeError as e:
+                applugin.plugin_logger.error("%s, falling back to polling", str(e))
+
         self.update_trains()
 
         # Assume refresh interval in the config as seconds
@@ -38,17 +58,92 @@ class TrainPlugin(applugin.AlarmpiPlugin):
         _timer.timeout.connect(trains_update_slot)
         _timer.start(refresh_interval_msec)
 
+    def setup_push_updates(self, client=None):
+        """Subscribe to train updates of the station. A table of departures is
+        loaded with a full fetch on each (re)connect and then updated one train at
+        a time.
+        Args:
+            client: optional MQTT client to use instead of the DigiTraffic client
+        """
+        self.departures = get_train_updates.DeparturesTable(self.parser)
+        self.update_signals = TrainUpdateSignals()
+        self.update_signals.train_signal.connect(self.handle_train_update)
+        self.update_signals.connected_signal.connect(
+            partial(self.run_with_retry, func=self.load_departures, delay_sec=10)
+        )
+
+        self.listener = get_train_updates.TrainUpdateListener(
+            self.config_data["station_code"],
+            on_train=self.update_signals.train_signal.emit,
+            on_connect=self.update_signals.connected_signal.emit,
+            client=client
+        )
+        self.run_with_retry(func=self.load_departures, delay_sec=10)
+        self.listener.start()
+
+        self.redraw_timer = QTimer(self.parent.main_window)
+        self.redraw_timer.timeout.connect(self.redraw_departures)
+        self.redraw_timer.start(PUSH_REDRAW_INTERVAL * 1000)
+
+    def load_departures(self):
+        """Start fetching all trains of the station to replace the departures table."""
+        self.start_fetch(self.fetch_trains, self.reset_departures)
+
+    def fetch_trains(self):
+        """Fetch all trains of the station, run in a worker thread."""
+        trains = self.parser.fetch_daily_train_data()
+        if isinstance(trains, dict):
+            return trains
+        return list(trains)
+
+    def reset_departures(self, trains):
+        """Replace the departures table with fetched trains and display it."""
+        if "error" in trains:
+            self.display_trains(trains)
+            return
+
+        self.departures.reset(trains)
+        self.display_trains(self.departures.next_departures(self.config_data["trains"]))
+
+    def redraw_departures(self):
+        """Slot for the redraw timer: redisplay the departures without departed trains,
+        or reload them if the last fetch failed.
+        """
+        if self.retry_flag:
+            self.run_with_retry(func=self.load_departures, delay_sec=10)
+            return
+
+        self.display_trains(self.departures.next_departures(self.config_data["trains"]))
+
+    def handle_train_update(self, train):
+        """Slot for a pushed train update: redisplay the departures if the update
+        changed them.
+        """
+        if self.departures.update(train):
+            self.display_trains(self.departures.next_departures(self.config_data["trains"]))
+
+    def shutdown(self, timeout_msec=1000):
+        """Stop any train update subscription and wait for running fetches."""
+        if self.listener is not None:
+            self.listener.stop()
+        super().shutdown(timeout_msec)
+
     def update_trains(self):
-        """Fetch new train data from DigiTraffic API and display on the right sidebar."""
+        """Start fetching new train data from DigiTraffic API in a background thread.
+        The result is displayed by display_trains.
+        """
+        self.start_fetch(self.parser.run, self.display_trains)
+
+    def display_trains(self, trains):
+        """Display train data on the left sidebar."""
         self.retry_flag = False
-        trains = self.parser.run()
 
         if "error" in trains:
-            self.error_label.setText("<html><span style='font-size:14px'>! not refreshed - {}</span></html>".format(trains["error"]["status_code"]))
+            self.display_error(self.error_label, trains)
             self.retry_flag = True
             return
 
-        self.error_label.clear()
+        self.view.clear(self.error_label)
         for i, label in enumerate(self.train_labels):
             try:
                 train = trains[i]
@@ -66,9 +161,9 @@ class TrainPlugin(applugin.AlarmpiPlugin):
                 if train["cancelled"]:
                     msg = f"{line_id} {scheduled_time} CANCELLED"
 
-                label.setText(msg)
-
             # API response may contain fewer trains than there are labels,
             # clear any remaining labels.
             except IndexError:
-                label.clear()
+                msg = ""
+
+            self.view.set_text(label, msg)
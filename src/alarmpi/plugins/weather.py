@@ -1,3 +1,4 @@
+import threading
 from functools import partial
 from PyQt5.QtWidgets import QLabel
 from PyQt5.QtCore import Qt, QTimer
@@ -14,6 +15,9 @@ class WeatherPlugin(applugin.AlarmpiPlugin):
         self.parser = get_weather.OpenWeatherMapClient(config_data)
         super().__init__(parent)
 
+        # Scaled weather icons by icon id
+        self.icon_pixmaps = {}
+
     def create_widgets(self):
         """Create and set QLabels for displaying weather components."""
         self.temperature_label = QLabel(self.parent.main_window)
@@ -28,6 +32,9 @@ class WeatherPlugin(applugin.AlarmpiPlugin):
 
     def setup_polling(self):
         """Setup polling for updating the weather every 30 minutes."""
+        if self.parent.config["plugins"]["openweathermap.org"].get("prefetch_icons"):
+            threading.Thread(target=get_weather.OpenWeatherMapClient.prefetch_weather_icons, daemon=True).start()
+
         self.update_weather()
 
         refresh_interval_msec = self.parent.config["plugins"]["openweathermap.org"]["refresh_interval"] * 1000
@@ -37,34 +44,42 @@ class WeatherPlugin(applugin.AlarmpiPlugin):
         _timer.start(refresh_interval_msec)
 
     def update_weather(self):
-        """Update the weather labels on the main window. Makes an API request to
-        openweathermap.org for current temperature and windspeed.
+        """Start fetching current temperature and windspeed from openweathermap.org
+        in a background thread. The result is displayed by display_weather.
         """
+        self.start_fetch(self.parser.fetch_and_format_weather, self.display_weather)
+
+    def display_weather(self, weather):
+        """Update the weather labels on the main window."""
         self.retry_flag = False
-        weather = self.parser.fetch_and_format_weather()
-        pixmap = QPixmap()
 
         if "error" in weather:
-            self.error_label.setText("<html><span style='font-size:14px'>! not refreshed - {}</span></html>".format(weather["error"]["status_code"]))
+            self.display_error(self.error_label, weather)
             self.retry_flag = True
             return
 
-        self.error_label.clear()
+        self.view.clear(self.error_label)
         temperature = weather["temp"]
         wind = weather["wind_speed_ms"]
 
         msg = f"{round(temperature)}°C"
-        self.temperature_label.setText(msg)
+        self.view.set_text(self.temperature_label, msg)
 
         msg = f"{round(wind)}m/s"
-        self.wind_label.setText(msg)
+        self.view.set_text(self.wind_label, msg)
 
-        # Weather icon is fetched via a separate API call which
-        # may fail regardless of the main call.
-        if weather["icon"] is None:
-            self.retry_flag = True
-            return
+        # Decode and scale each icon only once
+        pixmap = self.icon_pixmaps.get(weather["icon_id"])
+        if pixmap is None:
+            # Weather icon is fetched via a separate API call which
+            # may fail regardless of the main call.
+            if weather["icon"] is None:
+                self.retry_flag = True
+                return
+
+            pixmap = QPixmap()
+            pixmap.loadFromData(weather["icon"])
+            pixmap = pixmap.scaledToWidth(64)
+            self.icon_pixmaps[weather["icon_id"]] = pixmap
 
-        pixmap.loadFromData(weather["icon"])
-        pixmap = pixmap.scaledToWidth(64)
-        self.icon_label.setPixmap(pixmap)
+        self.view.set_pixmap(self.icon_label, pixmap, weather["icon_id"])
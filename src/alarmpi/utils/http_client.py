@@ -0,0 +1,63 @@
+# Shared HTTP client for network handlers. Connections are pooled and kept alive
+# between requests, so repeated requests to the same hosts skip the TCP and TLS
+# handshakes. All requests get a default timeout and are recorded in the metrics.
+
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from alarmpi.utils import metrics
+
+
+DEFAULT_TIMEOUT = (5, 15)  # seconds, (connect, read)
+POOL_CONNECTIONS = 8  # number of hosts to keep connection pools for
+POOL_MAXSIZE = 4  # maximum number of concurrent connections per host
+
+
+class TimeoutSession(requests.Session):
+    """A requests.Session applying a default timeout to requests without one.
+    The duration and size of each request is recorded per host. For streamed
+    responses the duration is the time until the headers were received.
+    """
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        with metrics.timed("http", host=urllib.parse.urlsplit(url).hostname) as measurement:
+            r = super().request(method, url, **kwargs)
+            measurement.error = not r.ok
+            if "Content-Length" in r.headers:
+                measurement.bytes = int(r.headers["Content-Length"])
+            elif not kwargs.get("stream"):
+                measurement.bytes = len(r.content)
+
+        return r
+
+
+def create_session():
+    """Create a session with a connection pool for each host. Requests exceeding
+    the per host connection limit wait for a free connection.
+    """
+    session = TimeoutSession()
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        pool_block=True
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+session = create_session()
+
+
+def get(url, **kwargs):
+    """Send a GET request using the shared session.
+    Args:
+        url (str): the url to request
+        kwargs: additional arguments passed to requests, eg. params, headers and timeout
+    Return:
+        a requests.Response
+    """
+    return session.get(url, **kwargs)
@@ -0,0 +1,145 @@
+# Persistent index of wakeup songs. Files matching the configured media path are
+# stored in an SQLite database along with their ID3 metadata and play history.
+# Rescans only read the metadata of new or modified files.
+
+import glob
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import mutagen
+
+from alarmpi.utils import utils
+
+
+event_logger = logging.getLogger("eventLogger")
+
+
+DB_PATH = os.path.join(utils.CACHE_DIR, "media.sqlite")
+
+
+class MediaIndex:
+    """Index of media files and their play counts in an SQLite database."""
+
+    def __init__(self, path=DB_PATH):
+        """Args:
+            path (str): path to the database file
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS songs (
+                    path TEXT PRIMARY KEY,
+                    mtime REAL NOT NULL,
+                    duration REAL,
+                    artist TEXT,
+                    title TEXT,
+                    last_played REAL,
+                    play_count INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+    def update(self, pattern):
+        """Sync the index with the files matching a glob pattern. Metadata is only
+        read for files that are new or modified since the last update.
+        Args:
+            pattern (str): glob pattern of the media files
+        Return:
+            the number of files (re)indexed
+        """
+        files = {}
+        for path in glob.iglob(pattern):
+            try:
+                files[path] = os.path.getmtime(path)
+            except OSError:
+                continue
+
+        with self.lock, self._connect() as conn:
+            indexed = dict(conn.execute("SELECT path, mtime FROM songs"))
+
+            removed = indexed.keys() - files.keys()
+            conn.executemany("DELETE FROM songs WHERE path = ?", ((path,) for path in removed))
+
+            changed = [path for path, mtime in files.items() if indexed.get(path) != mtime]
+            for path in changed:
+                metadata = MediaIndex.read_metadata(path)
+                conn.execute(
+                    """INSERT INTO songs (path, mtime, duration, artist, title) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(path) DO UPDATE SET
+                        mtime = excluded.mtime, duration = excluded.duration,
+                        artist = excluded.artist, title = excluded.title
+                    """,
+                    (path, files[path], metadata["duration"], metadata["artist"], metadata["title"])
+                )
+
+        if changed or removed:
+            event_logger.info("Media index updated: %d files indexed, %d removed", len(changed), len(removed))
+        return len(changed)
+
+    def choose(self, no_repeat=True):
+        """Choose a song from the index. The song is not marked played, see mark_played.
+        Args:
+            no_repeat (bool): whether to only choose among the songs played the fewest
+                times. Every song is then played once before any song repeats.
+        Return:
+            a dict of the path, duration, artist and title of the song, or None if
+            the index is empty
+        """
+        with self.lock, self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            if no_repeat:
+                rows = conn.execute("""
+                    SELECT * FROM songs WHERE play_count = (SELECT MIN(play_count) FROM songs)
+                """).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM songs").fetchall()
+
+        if not rows:
+            return None
+
+        return dict(random.choice(rows))
+
+    def mark_played(self, path):
+        """Record a play of a song: update its play count and the time it was last played.
+        Args:
+            path (str): path to the song
+        """
+        with self.lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE songs SET last_played = ?, play_count = play_count + 1 WHERE path = ?",
+                (time.time(), path)
+            )
+
+    @staticmethod
+    def read_metadata(path):
+        """Read the ID3 tags and duration of a media file. Default to the filename
+        as title if the tags cannot be read.
+        """
+        try:
+            metadata = utils.get_mp3_metadata(path)
+        except Exception:
+            metadata = {"artist": "", "title": os.path.basename(path)}
+
+        try:
+            metadata["duration"] = mutagen.File(path).info.length
+        except Exception:
+            metadata["duration"] = None
+
+        return metadata
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection committing on success and closing when done."""
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
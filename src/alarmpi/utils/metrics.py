@@ -0,0 +1,178 @@
+# Timing metrics for the stages of an alarm build, TTS engines, plugin fetches and HTTP
+# requests. Each measurement is written as a JSON line to the metrics log, and running
+# totals are served in the Prometheus text format from a local endpoint.
+
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+event_logger = logging.getLogger("eventLogger")
+metrics_logger = logging.getLogger("metricsLogger")
+
+
+DEFAULT_PORT = 9101
+METRIC_PREFIX = "alarmpi"
+
+
+class Measurement:
+    """A single measurement in progress. Code being measured can add bytes
+    transferred and mark the measurement as failed.
+    """
+
+    def __init__(self):
+        self.bytes = 0
+        self.error = False
+
+
+class Metrics:
+    """Thread-safe running totals of measurements, grouped by stage and labels."""
+
+    def __init__(self):
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def timed(self, stage, **labels):
+        """Context manager measuring the wall time of a block. The measurement is
+        marked as failed if the block raises an exception.
+        Args:
+            stage (str): name of the stage, eg. content or tts_setup
+            labels: labels identifying the measured item, eg. section="BBC_news"
+        Yields:
+            a Measurement
+        """
+        measurement = Measurement()
+        start = time.perf_counter()
+        try:
+            yield measurement
+        except BaseException:
+            measurement.error = True
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, measurement.bytes, measurement.error, **labels)
+
+    def record(self, stage, duration, bytes_transferred=0, error=False, **labels):
+        """Record a measurement.
+        Args:
+            stage (str): name of the stage
+            duration (float): wall time in seconds
+            bytes_transferred (int): number of bytes transferred
+            error (bool): whether the measured operation failed
+            labels: labels identifying the measured item
+        """
+        key = (stage, tuple(sorted(labels.items())))
+        with self.lock:
+            totals = self.totals.setdefault(
+                key, {"count": 0, "errors": 0, "seconds": 0.0, "bytes": 0, "last_seconds": 0.0}
+            )
+            totals["count"] += 1
+            totals["errors"] += int(error)
+            totals["seconds"] += duration
+            totals["bytes"] += bytes_transferred
+            totals["last_seconds"] = duration
+
+        metrics_logger.info(json.dumps({
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "stage": stage,
+            "labels": labels,
+            "seconds": round(duration, 4),
+            "bytes": bytes_transferred,
+            "error": error
+        }))
+
+    def render(self):
+        """Format the totals in the Prometheus text exposition format."""
+        families = [
+            ("stage_seconds_total", "counter", "Total wall time spent in a stage", "seconds"),
+            ("stage_runs_total", "counter", "Number of times a stage was run", "count"),
+            ("stage_errors_total", "counter", "Number of failed runs of a stage", "errors"),
+            ("stage_bytes_total", "counter", "Bytes transferred in a stage", "bytes"),
+            ("stage_last_seconds", "gauge", "Wall time of the latest run of a stage", "last_seconds"),
+        ]
+        with self.lock:
+            totals = sorted(self.totals.items())
+
+        lines = []
+        for name, type_, help_, field in families:
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {type_}")
+            for (stage, labels), values in totals:
+                label_str = ",".join(
+                    f'{label}="{Metrics.escape(value)}"' for label, value in (("stage", stage),) + labels
+                )
+                lines.append(f"{METRIC_PREFIX}_{name}{{{label_str}}} {values[field]}")
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self.lock:
+            self.totals.clear()
+
+    @staticmethod
+    def escape(value):
+        """Escape a label value for the text format."""
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = self.server.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """Serve metrics at /metrics from a background thread."""
+
+    def __init__(self, metrics, host="127.0.0.1", port=DEFAULT_PORT):
+        """Args:
+            metrics (Metrics): the metrics to serve
+            host (str): address to listen on, localhost by default
+            port (int): port to listen on, 0 to pick a free port
+        """
+        self.server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+        self.server.daemon_threads = True
+        self.server.metrics = metrics
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        event_logger.info("Serving metrics at http://%s:%s/metrics", *self.server.server_address)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+metrics = Metrics()
+
+
+def timed(stage, **labels):
+    """Measure a block in the shared metrics, see Metrics.timed."""
+    return metrics.timed(stage, **labels)
+
+def record(stage, duration, bytes_transferred=0, error=False, **labels):
+    """Record a measurement in the shared metrics, see Metrics.record."""
+    metrics.record(stage, duration, bytes_transferred, error, **labels)
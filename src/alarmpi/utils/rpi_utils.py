@@ -3,6 +3,7 @@
 
 import logging
 import os
+import threading
 from functools import wraps
 
 
@@ -41,27 +42,124 @@ def require_rpi(func):
     return wrapper
 
 
-@require_rpi
-def _get_value(file):
-    with open(file) as f:
-        value = int(f.read().strip())
-    return value
-
-@require_rpi
-def _set_value(file, value):
-    with open(file, "w") as f:
-        f.write(str(value))
+class Backlight:
+    """Display backlight control through the sysfs backlight files. The files are
+    opened once and kept open. Values written are tracked in memory: reads of a known
+    value and writes of an unchanged value do not touch the files.
+    """
+    RAMP_FPS = 30  # brightness updates per second during a ramp
+
+    def __init__(self, brightness_file=BRIGHTNESS_FILE, power_file=POWER_FILE):
+        self.files = {"brightness": brightness_file, "power": power_file}
+        self.fds = {}
+        self.values = {}
+        self.lock = threading.Lock()
+        self.ramp_thread = None
+        self.ramp_cancelled = threading.Event()
+
+    @require_rpi
+    def read(self, name):
+        """Read a value, either brightness or power, as integer."""
+        with self.lock:
+            if name not in self.values:
+                data = os.pread(self._get_fd(name), 16, 0)
+                self.values[name] = int(data.strip())
+            return self.values[name]
+
+    @require_rpi
+    def write(self, name, value):
+        """Write a value, either brightness or power, unless it is already set."""
+        with self.lock:
+            if self.values.get(name) == value:
+                return
+            os.pwrite(self._get_fd(name), str(value).encode(), 0)
+            self.values[name] = value
+
+    def get_brightness(self):
+        return self.read("brightness")
+
+    def set_brightness(self, brightness):
+        """Set brightness, cancelling any running ramp."""
+        self.cancel_ramp()
+        self.write("brightness", brightness)
+
+    def get_power_state(self):
+        """Get the screen power state as on/off."""
+        return "on" if self.read("power") == 0 else "off"
+
+    def set_power_state(self, state):
+        """Set the screen power state to on/off."""
+        self.write("power", 0 if state == "on" else 1)
+
+    def ramp_brightness(self, target, duration_sec, fps=RAMP_FPS):
+        """Gradually change brightness to target in a background thread.
+        Args:
+            target (int): brightness to end with
+            duration_sec (float): duration of the ramp in seconds
+            fps (int): number of brightness updates per second
+        """
+        self.cancel_ramp()
+        start = self.get_brightness()
+        if start is None:
+            return
+
+        self.ramp_cancelled.clear()
+        self.ramp_thread = threading.Thread(
+            target=self._ramp, args=(start, target, duration_sec, fps), daemon=True
+        )
+        self.ramp_thread.start()
+
+    def cancel_ramp(self):
+        """Stop a running brightness ramp at its current brightness."""
+        if self.ramp_thread is not None and self.ramp_thread is not threading.current_thread():
+            self.ramp_cancelled.set()
+            self.ramp_thread.join()
+            self.ramp_thread = None
+
+    def close(self):
+        """Cancel any ramp and close the files."""
+        self.cancel_ramp()
+        with self.lock:
+            for fd in self.fds.values():
+                os.close(fd)
+            self.fds.clear()
+
+    def _ramp(self, start, target, duration_sec, fps):
+        """Ramp thread: write evenly spaced brightness steps at a fixed rate."""
+        steps = max(1, int(duration_sec * fps))
+        for step in range(1, steps + 1):
+            if self.ramp_cancelled.wait(1 / fps):
+                return
+            try:
+                self.write("brightness", round(start + (target - start) * step / steps))
+            except OSError as e:
+                logger.warning("Brightness ramp stopped: %s", str(e))
+                return
+
+    def _get_fd(self, name):
+        """Open a file on first use. Read-only if the file is not writable."""
+        if name not in self.fds:
+            try:
+                self.fds[name] = os.open(self.files[name], os.O_RDWR)
+            except PermissionError:
+                self.fds[name] = os.open(self.files[name], os.O_RDONLY)
+        return self.fds[name]
+
+
+backlight = Backlight()
 
 
 def set_display_backlight_brightness(brightness):
     """Write a new brightness value to file."""
-    _set_value(BRIGHTNESS_FILE, brightness)
+    backlight.set_brightness(brightness)
 
 def toggle_display_backlight_brightness(low_brightness=12):
     """Reads current brightness value and toggles it between
     low and max values depending on current value.
     """
-    old = _get_value(BRIGHTNESS_FILE)
+    old = backlight.get_brightness()
+    if old is None:
+        return
 
     # set to furthest away from current brightness
     if abs(old-low_brightness) < abs(old-HIGH_BRIGHTNESS):
@@ -73,22 +171,12 @@ def toggle_display_backlight_brightness(low_brightness=12):
 
 def toggle_screen_state(state="on"):
     """Toggle screen state between on / off."""
-    value = 1
-    if state == "on":
-        value = 0
-
-    _set_value(POWER_FILE, value)
+    backlight.set_power_state(state)
 
 def get_and_set_screen_state(new_state):
     """Read the current screen power state and set it to new_state. Returns the
     previous value (on/off).
     """
-    previous_value = _get_value(POWER_FILE)
-    value = 1
-    if new_state == "on":
-        value = 0
-
-    _set_value(POWER_FILE, value)
-    if previous_value == 0:
-        return "on"
-    return "off"
+    previous_state = backlight.get_power_state()
+    backlight.set_power_state(new_state)
+    return previous_state
@@ -0,0 +1,104 @@
+# Startup profiling for the --profile-startup command line option. Records the time
+# spent importing each module and in each startup phase and logs a report once the
+# clock is running.
+
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+
+event_logger = logging.getLogger("eventLogger")
+
+
+class _TimedLoader:
+    """Wrapper for a module loader recording the time spent loading a module,
+    including the time spent importing the modules it imports.
+    """
+
+    def __init__(self, loader, timings):
+        self.loader = loader
+        self.timings = timings
+
+    def create_module(self, spec):
+        start = time.perf_counter()
+        module = self.loader.create_module(spec)
+        self.timings[spec.name] = time.perf_counter() - start
+        return module
+
+    def exec_module(self, module):
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            name = module.__spec__.name
+            self.timings[name] = self.timings.get(name, 0) + time.perf_counter() - start
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+
+class _ImportTimingFinder:
+    """Meta path finder wrapping the loaders found by the other finders in
+    _TimedLoaders.
+    """
+
+    def __init__(self, timings):
+        self.timings = timings
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self.timings)
+                return spec
+
+        return None
+
+
+class StartupProfiler:
+    """Record import times and durations of named startup phases."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+        self.imports = {}
+        self.finder = _ImportTimingFinder(self.imports)
+
+    def enable(self):
+        """Start recording import times."""
+        sys.meta_path.insert(0, self.finder)
+
+    def disable(self):
+        """Stop recording import times."""
+        if self.finder in sys.meta_path:
+            sys.meta_path.remove(self.finder)
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager recording the duration of a startup phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def report(self, top=20):
+        """Log the phase durations and the slowest imports.
+        Args:
+            top (int): number of imports to include
+        """
+        self.disable()
+        lines = [f"Startup took {time.perf_counter() - self.start:.3f}s"]
+        lines.extend(f"  {name:<30} {duration:.3f}s" for name, duration in self.phases)
+
+        lines.append("Slowest imports (including their own imports):")
+        slowest = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:top]
+        lines.extend(f"  {name:<30} {duration:.3f}s" for name, duration in slowest)
+
+        event_logger.info("\n".join(lines))
+        return lines
@@ -2,12 +2,13 @@ import os.path
 import re
 import subprocess
 from datetime import datetime, date
+from functools import lru_cache
 
-from mutagen.id3 import ID3, ID3NoHeaderError
 from PyQt5.QtGui import QPixmap
 
 
 BASE = os.path.join(os.path.dirname(__file__), "..", "..", "..")
+CACHE_DIR = os.path.join(BASE, "cache")
 
 
 def time_str_to_dt(s):
@@ -43,9 +44,10 @@ def set_volume(card, level):
     """
     subprocess.run(f"amixer --quiet -c {card} sset PCM {level}%".split())
 
+@lru_cache(maxsize=None)
 def get_volume_icon(mode):
     """Determine icon set to use as volume level. If Adwaita Ubuntu theme exists use its icons.
-    Otherwise use custom icons.
+    Otherwise use custom icons. Icons are cached after the first call for each mode.
     Args:
         mode (str): volume level: muted/low/medium/high
     Return:
@@ -84,6 +86,9 @@ def get_mp3_metadata(file):
         A dictionary containing artist and title. Default to 
         filename if ID3 tags cannot be read.
     """
+    # mutagen is imported on first use to keep it out of the GUI startup
+    from mutagen.id3 import ID3, ID3NoHeaderError
+
     try:
         audio = ID3(file)
         metadata = {
@@ -0,0 +1,85 @@
+# Volume control for the settings window's volume slider. The mixer is opened once
+# and rapid volume changes are merged into a single write of the latest level.
+
+import logging
+
+from PyQt5.QtCore import QTimer
+
+try:
+    import alsaaudio
+except ImportError:
+    alsaaudio = None
+
+from alarmpi.utils import utils
+
+
+event_logger = logging.getLogger("eventLogger")
+
+
+WRITE_INTERVAL = 100  # milliseconds, minimum time between volume writes
+MIXER_CONTROL = "PCM"
+
+
+class VolumeController:
+    """Get and set the volume of an ALSA sound card. Uses a persistent pyalsaaudio
+    mixer handle when available and falls back to amixer.
+    """
+
+    def __init__(self, card, write_interval=WRITE_INTERVAL):
+        """Args:
+            card (int): the sound card to control, see aplay -l for available cards
+            write_interval (int): minimum time between volume writes in milliseconds
+        """
+        self.card = card
+        self.mixer = None
+        self.pending_level = None
+
+        if alsaaudio is not None:
+            try:
+                self.mixer = alsaaudio.Mixer(MIXER_CONTROL, cardindex=card)
+            except alsaaudio.ALSAAudioError as e:
+                event_logger.warning("Couldn't open mixer for card %s: %s", card, str(e))
+
+        self.write_timer = QTimer()
+        self.write_timer.setSingleShot(True)
+        self.write_timer.setInterval(write_interval)
+        self.write_timer.timeout.connect(self.flush)
+
+    def get_volume(self):
+        """Get the current volume level.
+        Return:
+            the volume level as integer from 0 to 100 or None if it cannot be read
+        """
+        try:
+            if self.mixer is not None:
+                return self.mixer.getvolume()[0]
+            return utils.get_volume(self.card)
+        except Exception as e:
+            event_logger.debug("Couldn't read volume level: %s", str(e))
+            return None
+
+    def set_volume(self, level):
+        """Request a volume level. The level is written when the write interval has
+        passed since the previous write; any levels requested in between are replaced
+        by the latest one.
+        Args:
+            level (int): volume level as percentage, 0 - 100
+        """
+        self.pending_level = level
+        if not self.write_timer.isActive():
+            self.write_timer.start()
+
+    def flush(self):
+        """Write any pending volume level immediately."""
+        self.write_timer.stop()
+        if self.pending_level is None:
+            return
+
+        level, self.pending_level = self.pending_level, None
+        try:
+            if self.mixer is not None:
+                self.mixer.setvolume(level)
+            else:
+                utils.set_volume(self.card, level)
+        except Exception as e:
+            event_logger.warning("Couldn't set volume level: %s", str(e))
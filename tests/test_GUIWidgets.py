@@ -1,5 +1,8 @@
 import os.path
 import pytest
+from unittest.mock import patch
+
+from freezegun import freeze_time
 
 from alarmpi.core import apconfig, GUIWidgets
 
@@ -67,3 +70,26 @@ def test_clear_alarm_changes_current_alarm_time(settings_window):
     assert settings_window.alarm_time_status_label.text() == "Alarm cleared"
     assert settings_window.current_alarm_time == ""
 
+
+
+def test_clock_tick_updates_date_on_date_change():
+    """Does the clock tick update the date label only when the date changes and
+    schedule the next tick to the next second boundary?
+    """
+    with freeze_time("2024-03-01 23:59:58.250"):
+        alarm_window = GUIWidgets.AlarmWindow()
+        assert alarm_window.clock_timer.remainingTime() in range(745, 751)
+
+    with patch.object(alarm_window.date_label, "setText") as mock_set_text:
+        with freeze_time("2024-03-01 23:59:59"):
+            alarm_window.tick()
+        mock_set_text.assert_not_called()
+
+        with freeze_time("2024-03-02 00:00:00"):
+            alarm_window.tick()
+        mock_set_text.assert_called_once_with("Sat 02.03.2024")
+
+    alarm_window.pause_clock()
+    assert not alarm_window.clock_timer.isActive()
+    alarm_window.resume_clock()
+    assert alarm_window.clock_timer.isActive()
@@ -1,8 +1,12 @@
 import pytest
 import os.path
+import threading
+import time
 import requests
+from datetime import datetime, timedelta
 from unittest.mock import patch, Mock
 
+import pydub
 from freezegun import freeze_time
 
 from alarmpi.core import apconfig, alarm_builder
@@ -98,3 +102,207 @@ def test_wakeup_song_played(mock_media_play_worker):
 
     builder.play()
     builder.media_play_thread.start.assert_called()
+
+@patch("alarmpi.core.alarm_builder.apaudio.pcm_cache")
+def test_wakeup_song_chosen_once_per_alarm(mock_pcm_cache, dummy_alarm_builder):
+    """Do later prebuild stages keep the chosen wakeup song and its decoded copy?"""
+    dummy_alarm_builder.config["main"]["TTS"] = False
+    dummy_alarm_builder.config["media"]["enabled"] = True
+    dummy_alarm_builder.iter_contents = lambda deadline=None: iter(["greeting"])
+
+    def set_wakeup_song():
+        dummy_alarm_builder.media_play_thread.song_path = "song.mp3"
+        dummy_alarm_builder.media_play_thread.cache_decoded = True
+
+    with patch.object(dummy_alarm_builder, "set_wakeup_song", side_effect=set_wakeup_song) as mock_set_wakeup_song:
+        dummy_alarm_builder.fetch()
+        dummy_alarm_builder.refresh()
+
+    mock_set_wakeup_song.assert_called_once()
+    mock_pcm_cache.prune.assert_called_once_with([alarm_builder.BEEP_PATH, "song.mp3"])
+
+def test_fetch_contents_keeps_config_order(dummy_alarm_builder):
+    """Are concurrently built content sections returned in configuration order?"""
+    dummy_alarm_builder.config["content"]["openweathermap.org"]["enabled"] = True
+
+    def build_content(section):
+        # Finish the first section last
+        if section["handler"] == "get_weather.py":
+            time.sleep(0.2)
+        return section["handler"]
+
+    dummy_alarm_builder.build_content = build_content
+    assert list(dummy_alarm_builder.fetch_contents()) == ["get_weather.py", "get_bbc_news.py"]
+
+def test_fetch_contents_skips_timed_out_section(dummy_alarm_builder):
+    """Is a content section exceeding its timeout left out of the alarm?"""
+    dummy_alarm_builder.config["content"]["openweathermap.org"]["enabled"] = True
+    dummy_alarm_builder.config["content"]["openweathermap.org"]["timeout"] = 0.1
+
+    def build_content(section):
+        if section["handler"] == "get_weather.py":
+            time.sleep(0.5)
+        return section["handler"]
+
+    dummy_alarm_builder.build_content = build_content
+    assert list(dummy_alarm_builder.fetch_contents()) == ["get_bbc_news.py"]
+
+def test_fetch_contents_uses_cached_section_after_deadline(dummy_alarm_builder):
+    """Is a content section missing the deadline replaced by its previously fetched content?"""
+    dummy_alarm_builder.config["content"]["openweathermap.org"]["enabled"] = True
+    dummy_alarm_builder.section_cache["openweathermap.org"] = "Yesterday's weather"
+
+    def build_content(section):
+        if section["handler"] == "get_weather.py":
+            time.sleep(0.5)
+        return section["handler"]
+
+    dummy_alarm_builder.build_content = build_content
+    deadline = datetime.now() + timedelta(seconds=0.1)
+    assert list(dummy_alarm_builder.fetch_contents(deadline)) == ["Yesterday's weather", "get_bbc_news.py"]
+
+def test_stream_plays_sections_in_order(dummy_alarm_builder):
+    """Does build_and_stream play each section in order and start playback
+    before later sections are ready?
+    """
+    played = []
+    dummy_alarm_builder.iter_contents = lambda alarm_time=None: iter(["greeting", "news", "end"])
+    dummy_alarm_builder.get_tts_client = Mock()
+    tts_client = dummy_alarm_builder.get_tts_client.return_value
+    tts_client.synthesize.side_effect = lambda text: text
+    tts_client.play.side_effect = played.append
+    on_first_audio = Mock()
+
+    dummy_alarm_builder.build_and_stream(on_first_audio=on_first_audio)
+    assert played == ["greeting", "news", "end"]
+    on_first_audio.assert_called_once()
+    assert dummy_alarm_builder.time_to_first_audio is not None
+
+@patch("alarmpi.core.alarm_builder.AlarmBuilder.play_beep")
+def test_stream_plays_beep_when_nothing_synthesized(mock_play_beep, dummy_alarm_builder):
+    """Is the beep played when no section could be synthesized?"""
+    dummy_alarm_builder.iter_contents = lambda alarm_time=None: iter(["greeting"])
+    dummy_alarm_builder.get_tts_client = Mock()
+    dummy_alarm_builder.get_tts_client.return_value.synthesize.side_effect = requests.exceptions.ConnectionError
+
+    dummy_alarm_builder.build_and_stream()
+    mock_play_beep.assert_called()
+
+@pytest.fixture
+def artifact_dir(tmp_path):
+    """Save prebuilt alarms to a temporary directory."""
+    with patch("alarmpi.core.alarm_builder.ARTIFACT_DIR", str(tmp_path)), \
+            patch("alarmpi.core.alarm_builder.ARTIFACT_AUDIO_FILE", str(tmp_path / "alarm.wav")), \
+            patch("alarmpi.core.alarm_builder.ARTIFACT_METADATA_FILE", str(tmp_path / "alarm.json")):
+        yield tmp_path
+
+def test_synthesize_reuses_unchanged_sections(dummy_alarm_builder, artifact_dir):
+    """Does re-synthesizing only synthesize sections whose text changed?"""
+    dummy_alarm_builder.tts_client = Mock()
+    dummy_alarm_builder.tts_client.synthesize.side_effect = lambda text, deadline=None: pydub.AudioSegment.silent(len(text))
+
+    dummy_alarm_builder.contents = ["Good morning.", "News.", "Bye."]
+    dummy_alarm_builder.synthesize()
+    assert dummy_alarm_builder.tts_client.synthesize.call_count == 3
+
+    dummy_alarm_builder.contents = ["Good morning.", "Other news.", "Bye."]
+    dummy_alarm_builder.synthesize()
+    assert dummy_alarm_builder.tts_client.synthesize.call_count == 4
+    dummy_alarm_builder.tts_client.synthesize.assert_called_with("Other news.", deadline=None)
+    assert len(dummy_alarm_builder.audio) == len("Good morning.Other news.Bye.")
+
+def test_saved_alarm_loaded_after_restart(dummy_alarm_builder, artifact_dir):
+    """Is a saved alarm loaded, split back to its sections, by a new builder?"""
+    dummy_alarm_builder.tts_client = Mock()
+    dummy_alarm_builder.tts_client.synthesize.side_effect = (
+        lambda text, deadline=None: pydub.AudioSegment.silent(len(text) * 10)
+    )
+    dummy_alarm_builder.contents = ["Good morning.", "News."]
+    dummy_alarm_builder.synthesize()
+
+    builder = alarm_builder.AlarmBuilder(dummy_alarm_builder.config)
+    assert builder.load_artifact()
+    assert [text for text, _ in builder.section_audio] == ["Good morning.", "News."]
+    assert len(builder.section_audio[1][1]) == len("News.") * 10
+
+    # A different alarm time should not load the saved alarm
+    builder.config["main"]["alarm_time"] = "09:30"
+    assert not builder.load_artifact()
+
+def test_synthesize_keeps_previous_alarm_after_deadline(dummy_alarm_builder, artifact_dir):
+    """Is the previously built alarm kept if changed sections cannot be synthesized
+    before the deadline?
+    """
+    dummy_alarm_builder.tts_client = Mock()
+    dummy_alarm_builder.tts_client.synthesize.side_effect = lambda text, deadline=None: pydub.AudioSegment.silent(len(text))
+    dummy_alarm_builder.contents = ["Good morning.", "News."]
+    dummy_alarm_builder.synthesize()
+    previous_audio = dummy_alarm_builder.audio
+
+    dummy_alarm_builder.contents = ["Good morning.", "Other news."]
+    dummy_alarm_builder.synthesize(deadline=datetime.now() - timedelta(seconds=1))
+    assert dummy_alarm_builder.tts_client.synthesize.call_count == 2
+    assert dummy_alarm_builder.audio is previous_audio
+
+@patch("alarmpi.core.alarm_builder.AlarmBuilder.play_beep")
+def test_beep_played_after_deadline_missed_without_previous_alarm(mock_play_beep, dummy_alarm_builder, artifact_dir):
+    """Is the beep played, and nothing saved, when synthesizing misses the deadline
+    and there is no earlier alarm?
+    """
+    dummy_alarm_builder.tts_client = Mock()
+    dummy_alarm_builder.contents = ["Good morning.", "News."]
+    dummy_alarm_builder.synthesize(deadline=datetime.now() - timedelta(seconds=1))
+    assert dummy_alarm_builder.audio is None
+    assert not os.path.exists(alarm_builder.ARTIFACT_METADATA_FILE)
+
+    dummy_alarm_builder.play()
+    mock_play_beep.assert_called()
+
+def test_play_does_not_wait_for_late_stage(dummy_alarm_builder, artifact_dir):
+    """Is the last finished alarm played while a stage running late is still synthesizing,
+    and the late result discarded?
+    """
+    dummy_alarm_builder.config["media"]["enabled"] = False
+    synthesizing = threading.Event()
+    release = threading.Event()
+
+    def synthesize(text, deadline=None):
+        if text == "Other news.":
+            synthesizing.set()
+            release.wait(5)
+        return pydub.AudioSegment.silent(len(text))
+
+    dummy_alarm_builder.tts_client = Mock()
+    dummy_alarm_builder.tts_client.synthesize.side_effect = synthesize
+    dummy_alarm_builder.contents = ["Good morning.", "News."]
+    dummy_alarm_builder.synthesize()
+    previous_audio = dummy_alarm_builder.audio
+
+    dummy_alarm_builder.contents = ["Good morning.", "Other news."]
+    stage = threading.Thread(target=dummy_alarm_builder.synthesize)
+    stage.start()
+    assert synthesizing.wait(5)
+
+    dummy_alarm_builder.play()
+    dummy_alarm_builder.tts_client.play.assert_called_once_with(previous_audio)
+
+    release.set()
+    stage.join(5)
+    assert dummy_alarm_builder.audio is None
+
+def test_fetch_contents_section_timeouts_do_not_add_up(dummy_alarm_builder):
+    """Are the timeouts of slow content sections counted from submitting them rather than
+    from when the previous section was waited for?
+    """
+    dummy_alarm_builder.config["content"]["openweathermap.org"]["enabled"] = True
+    dummy_alarm_builder.config["content"]["openweathermap.org"]["timeout"] = 0.2
+    dummy_alarm_builder.config["content"]["BBC_news"]["timeout"] = 0.2
+
+    def build_content(section):
+        time.sleep(0.5)
+        return section["handler"]
+
+    dummy_alarm_builder.build_content = build_content
+    start = time.monotonic()
+    assert list(dummy_alarm_builder.fetch_contents()) == []
+    assert time.monotonic() - start < 0.35
@@ -0,0 +1,103 @@
+import os
+import threading
+from unittest.mock import patch
+
+import pydub
+
+from alarmpi.core import apaudio
+
+
+class FakeOutput:
+    """Output stream recording written audio. Writes block while paused."""
+
+    def __init__(self, device):
+        self.data = bytearray()
+        self.drained = False
+        self.writable = threading.Event()
+        self.writable.set()
+
+    def write(self, data):
+        self.writable.wait()
+        self.data.extend(data)
+
+    def drop(self):
+        pass
+
+    def drain(self):
+        self.drained = True
+
+    def close(self):
+        pass
+
+
+def create_player():
+    outputs = []
+
+    def output_factory(device):
+        outputs.append(FakeOutput(device))
+        return outputs[-1]
+
+    return apaudio.AudioPlayer(output_factory=output_factory), outputs
+
+def test_queued_audio_played_back_to_back():
+    """Is queued audio written to a single output stream in order without gaps?"""
+    player, outputs = create_player()
+    first = apaudio.AudioPlayer.convert(pydub.AudioSegment.silent(100))
+    second = apaudio.AudioPlayer.convert(pydub.AudioSegment.silent(50)).apply_gain(10)
+
+    player.enqueue(first)
+    player.play(second)
+
+    assert len(outputs) == 1
+    assert bytes(outputs[0].data) == first.raw_data + second.raw_data
+
+def test_output_drained_before_play_returns():
+    """Does play wait for the output to play the audio buffered in the device?"""
+    player, outputs = create_player()
+    player.play(pydub.AudioSegment.silent(10))
+    assert outputs[0].drained
+
+def test_stop_discards_queued_audio():
+    """Does stop release a waiting play call and discard its remaining audio?"""
+    player, outputs = create_player()
+    player.play(pydub.AudioSegment.silent(10))
+    outputs[0].writable.clear()
+
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (player.play(pydub.AudioSegment.silent(5000)), done.set()))
+    thread.start()
+
+    assert not done.wait(0.2)
+    player.stop()
+    outputs[0].writable.set()
+    assert done.wait(1)
+
+    thread.join()
+    assert len(outputs[0].data) < len(apaudio.AudioPlayer.convert(pydub.AudioSegment.silent(5000)).raw_data)
+
+def test_pcm_cache_decodes_once(tmp_path):
+    """Is an audio file decoded only on first load and played from the cache after?"""
+    source = tmp_path / "song.wav"
+    pydub.AudioSegment.silent(200, frame_rate=22050).export(source, format="wav")
+    cache = apaudio.PCMCache(str(tmp_path / "pcm"))
+
+    with patch("pydub.AudioSegment.from_file", wraps=pydub.AudioSegment.from_file) as mock_from_file:
+        first = cache.load(str(source))
+        second = cache.load(str(source))
+
+    mock_from_file.assert_called_once()
+    assert second.frame_rate == apaudio.OUTPUT_FRAME_RATE
+    assert second.raw_data[:] == first.raw_data[:]
+    assert len(second) == 200
+
+def test_pcm_cache_prune(tmp_path):
+    """Are cached copies of other files removed on prune?"""
+    cache = apaudio.PCMCache(str(tmp_path / "pcm"))
+    paths = []
+    for name in ("beep.wav", "song.wav"):
+        pydub.AudioSegment.silent(10).export(tmp_path / name, format="wav")
+        paths.append(str(tmp_path / name))
+        cache.load(paths[-1])
+
+    cache.prune(paths[:1])
+    assert os.listdir(tmp_path / "pcm") == [os.path.basename(cache._get_file_path(paths[0]))]
@@ -0,0 +1,103 @@
+import time
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+
+from dateutil import tz
+
+from PyQt5.QtCore import QCoreApplication, QThread
+from PyQt5.QtWidgets import QWidget
+
+from alarmpi.core import applugin
+from alarmpi.plugins import trains
+
+
+@pytest.fixture
+def dummy_plugin():
+    """Create an AlarmpiPlugin with a mocked parent."""
+    parent = Mock()
+    parent.main_window = QWidget()
+    return applugin.AlarmpiPlugin(parent)
+
+def process_events_until(condition, timeout_sec=2):
+    """Run the event loop until condition is true."""
+    end = time.monotonic() + timeout_sec
+    while not condition() and time.monotonic() < end:
+        QCoreApplication.processEvents()
+        time.sleep(0.01)
+
+def test_fetch_result_passed_to_gui_thread(dummy_plugin):
+    """Is the fetch run in a worker thread and its result passed to the slot in the GUI thread?"""
+    results = []
+    gui_thread = QThread.currentThread()
+
+    def fetch():
+        return QThread.currentThread() is not gui_thread
+
+    dummy_plugin.start_fetch(fetch, lambda result: results.append((result, QThread.currentThread() is gui_thread)))
+    process_events_until(lambda: results)
+    assert results == [(True, True)]
+
+def test_timed_out_fetch_is_cancelled(dummy_plugin):
+    """Does a fetch exceeding its timeout pass an error to the slot and discard the late result?"""
+    results = []
+    dummy_plugin.start_fetch(lambda: time.sleep(1.5) or "late", results.append, timeout_sec=1)
+    process_events_until(lambda: results)
+    assert results[0]["error"]["status_code"] == 504
+
+    dummy_plugin.shutdown(timeout_msec=2000)
+    QCoreApplication.processEvents()
+    assert len(results) == 1
+
+def test_label_view_updates_changed_labels_only():
+    """Are labels only updated when their displayed content changes?"""
+    view = applugin.LabelView()
+    label = Mock()
+
+    assert view.set_text(label, "12°C")
+    assert not view.set_text(label, "12°C")
+    assert view.set_text(label, "13°C")
+    assert label.setText.call_count == 2
+
+    assert view.set_pixmap(label, Mock(), "04d")
+    assert not view.set_pixmap(label, Mock(), "04d")
+    label.setPixmap.assert_called_once()
+
+def test_pushed_departures_reloaded_after_failed_fetch():
+    """Are pushed departures reloaded by the redraw timer after a failed fetch and
+    departed trains removed when redrawn?
+    """
+    parent = Mock()
+    parent.main_window = QWidget()
+    parent.config = {"plugins": {"HSL": {"station_code": "KE", "trains": 2}}}
+    plugin = trains.TrainPlugin(parent)
+    plugin.train_labels = [Mock(), Mock()]
+    plugin.error_label = Mock()
+
+    error = {"error": {"message": "Service unavailable", "status_code": 503}}
+    plugin.fetch_trains = Mock(return_value=error)
+    with patch("alarmpi.handlers.get_train_updates.TrainUpdateListener"):
+        plugin.setup_push_updates()
+    process_events_until(lambda: plugin.view.get(plugin.error_label))
+    assert "503" in plugin.view.get(plugin.error_label)
+
+    # A failed retry leaves reloading to the redraw timer
+    plugin.load_departures()
+    process_events_until(lambda: plugin.retry_flag)
+    assert plugin.fetch_trains.call_count == 2
+
+    # The redraw timer reloads the departures
+    plugin.fetch_trains = Mock(return_value=[])
+    plugin.redraw_departures()
+    process_events_until(lambda: plugin.fetch_worker is None)
+    plugin.fetch_trains.assert_called_once()
+    assert not plugin.retry_flag
+
+    # Departed trains are removed when redrawn
+    departed = {"commuterLineID": "K", "scheduledTime": datetime.now(tz=tz.tzlocal()) - timedelta(hours=1),
+                "liveEstimateTime": None, "cancelled": False}
+    departed["sortKey"] = departed["scheduledTime"]
+    plugin.departures.departures = {1: departed}
+    plugin.redraw_departures()
+    assert plugin.departures.departures == {}
+    plugin.shutdown()
@@ -0,0 +1,93 @@
+import os
+import pytest
+import time
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+import pydub
+
+from alarmpi.core import aptts
+
+
+@pytest.fixture
+def dummy_cache(tmp_path):
+    """Create a TTSCache in a temporary directory."""
+    return aptts.TTSCache(str(tmp_path), max_size=10**6)
+
+def test_cached_lines_not_synthesized_again(dummy_cache):
+    """Does synthesize only call the TTS engine for lines missing from the cache?"""
+    client = aptts.AlarmpiTTS()
+    client.cache = dummy_cache
+    client.setup = Mock(return_value=pydub.AudioSegment.silent(100))
+
+    client.synthesize("Good morning.\nThats all for now.")
+    assert client.setup.call_count == 2
+
+    audio = client.synthesize("Good evening.\nThats all for now.")
+    assert client.setup.call_count == 3
+    client.setup.assert_called_with("Good evening.")
+    assert len(audio) == 200
+    assert dummy_cache.stats() == {"hits": 1, "misses": 3}
+
+def test_only_changed_sentences_synthesized_again(dummy_cache):
+    """Are only new or changed sentences of an edited text synthesized again?"""
+    client = aptts.AlarmpiTTS()
+    client.cache = dummy_cache
+    client.setup = Mock(side_effect=lambda text: pydub.AudioSegment.silent(len(text)))
+
+    client.synthesize("Good morning. It is 7:00.\nFirst headline.")
+    assert client.setup.call_count == 3
+
+    audio = client.synthesize("Good morning. It is 7:01.\nFirst headline.")
+    assert [call.args[0] for call in client.setup.call_args_list[3:]] == ["It is 7:01."]
+    assert len(audio) == len("Good morning.It is 7:01.First headline.")
+
+def test_cache_evicts_least_recently_used(dummy_cache):
+    """Are least recently used files removed when the cache exceeds its size limit?"""
+    audio = pydub.AudioSegment.silent(1000)
+    dummy_cache.put("old", audio)
+    dummy_cache.put("new", audio)
+
+    # Make 'old' the least recently used entry and limit the cache to a single file
+    os.utime(dummy_cache._get_file_path("old"), (0, 0))
+    dummy_cache.max_size = os.path.getsize(dummy_cache._get_file_path("new"))
+    dummy_cache.evict()
+
+    assert dummy_cache.get("old") is None
+    assert dummy_cache.get("new") is not None
+
+def test_synthesize_stops_at_deadline(dummy_cache):
+    """Is synthesizing stopped between sentences once the deadline has passed, and is
+    each request limited to the time left?
+    """
+    client = aptts.AlarmpiTTS()
+    client.cache = dummy_cache
+    # Synthesize a sentence at a time to let the deadline pass between them
+    client.MAX_CONCURRENT_SEGMENTS = 1
+    timeouts = []
+
+    def setup(text):
+        timeouts.append(client.request_timeout())
+        time.sleep(0.1)
+        return pydub.AudioSegment.silent(100)
+
+    client.setup = Mock(side_effect=setup)
+    with pytest.raises(aptts.DeadlineExceeded):
+        client.synthesize("First.\nSecond.\nThird.", deadline=datetime.now() + timedelta(seconds=0.15))
+
+    assert client.setup.call_count == 2
+    assert 0 < timeouts[1] < timeouts[0] <= 0.15
+
+def test_missing_sentences_synthesized_concurrently(dummy_cache):
+    """Are the sentences of a section missing from the cache synthesized concurrently
+    and joined in order?
+    """
+    client = aptts.AlarmpiTTS()
+    client.cache = dummy_cache
+    client.setup = Mock(side_effect=lambda text: (time.sleep(0.2), pydub.AudioSegment.silent(len(text)))[1])
+
+    start = time.monotonic()
+    audio = client.synthesize("One.\nTwo two.\nThree three three.\nFour.")
+    assert time.monotonic() - start < 0.6
+    assert client.setup.call_count == 4
+    assert len(audio) == len("One.Two two.Three three three.Four.")
@@ -44,7 +44,7 @@ class TestClock():
         dummy_clock.settings_window.numpad_buttons["set"].click()
 
         assert dummy_clock.alarm_timer.isActive()
-        assert dummy_clock.alarm_build_timer.isActive()
+        assert dummy_clock.prebuild_scheduler.is_active()
 
         mock_display.assert_called_with("00:10")
 
@@ -56,13 +56,15 @@ class TestClock():
         assert active_alarm is not None
 
     @patch("PyQt5.QtWidgets.QLCDNumber.display")
-    def test_clear_alarm_clears_screen_and_stops_timers(self, mock_display, dummy_clock):
-        """Does 'Clearm alarm' button stop timers for alarm build and play and clear
-        main window and settings window labels?
+    @patch("alarmpi.utils.rpi_utils.backlight.cancel_ramp")
+    def test_clear_alarm_clears_screen_and_stops_timers(self, mock_cancel_ramp, mock_display, dummy_clock):
+        """Does 'Clearm alarm' button stop timers for alarm build and play, stop
+        a running sunrise and clear main window and settings window labels?
         """
         dummy_clock.settings_window.numpad_buttons["clear"].click()
         assert not dummy_clock.alarm_timer.isActive()
-        assert not dummy_clock.alarm_build_timer.isActive()
+        assert not dummy_clock.prebuild_scheduler.is_active()
+        mock_cancel_ramp.assert_called()
 
         mock_display.assert_called_with("")
 
@@ -120,7 +122,7 @@ class TestClock():
         assert label_time == "07:16"
 
     @patch("alarmpi.utils.rpi_utils.set_display_backlight_brightness")
-    @patch("alarmpi.utils.rpi_utils._get_value")
+    @patch("alarmpi.utils.rpi_utils.backlight.get_brightness")
     def test_brightness_toggle(self, mock_get_value, mock_set_brightness, dummy_clock):
         """Does the backlight toggle change brightness from low to high?"""
         mock_get_value.return_value = 12
@@ -204,10 +206,9 @@ class TestClock():
 class TestAlarmWorker():
 
     @freeze_time("2021-07-30 21:03")
-    @patch("alarmpi.core.clock.AlarmWorker._play")
-    def test_build_and_play_alarm_time_override(self, mock_play, capsys):
-        """Does build_and_play task type temporarily override alarm_time in config
-        with current time?
+    def test_build_and_play_announces_current_time(self):
+        """Does build_and_play task type announce the current time in the greeting
+        without changing alarm_time in config?
         """
         config = apconfig.AlarmConfig(PATH_TO_CONFIG)
         builder = alarm_builder.AlarmBuilder(config)
@@ -217,9 +218,8 @@ class TestAlarmWorker():
         worker.run()
         assert builder.config["main"]["alarm_time"] == "07:02"
 
-        # Check the overriden time is present in the output generated by the alarm build
-        captured = capsys.readouterr()
-        assert "09:03" in captured.out
+        synthesized = [call.args[0] for call in builder.get_tts_client.return_value.synthesize.call_args_list]
+        assert any("09:03" in text for text in synthesized)
 
 
 #### RadioStreamer
@@ -1,7 +1,19 @@
+import json
+import threading
+import time
 import requests
-from unittest.mock import patch, mock_open
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch, mock_open, Mock
 
-from alarmpi.handlers import get_weather, get_next_trains
+import pydub
+import pytest
+from dateutil import tz
+
+from alarmpi.handlers import (
+    get_weather, get_next_trains, get_train_updates, get_google_translate_tts, get_gcp_tts, get_bbc_news
+)
+from alarmpi.core import apcontent
+from alarmpi.utils import http_client
 
 
 
@@ -10,18 +22,70 @@ def test_failing_train_api_request():
     parser = get_next_trains.TrainParser({"station_code": "XYZ"})
 
     # Error raised during request
-    with patch("requests.get") as mock_get:
+    with patch("alarmpi.utils.http_client.get") as mock_get:
         mock_get.side_effect = requests.exceptions.RequestException("Something went wrong")
         res = parser.run()
         assert res == {"error": {"message": "Something went wrong", "status_code": 503}}
 
     # Unsuccesful response from the API
-    with patch("requests.get") as mock_get:
+    with patch("alarmpi.utils.http_client.get") as mock_get:
         mock_get.return_value.status_code = 500
         mock_get.return_value.text = "Something went wrong"
         res = parser.run()
         assert res == {"error": {"message": "Something went wrong", "status_code": 500}}
 
+def test_train_response_read_error_returned():
+    """Is an error reading or parsing a streamed train API response returned as an error?"""
+    parser = get_next_trains.TrainParser({"station_code": "XYZ", "trains": 2})
+
+    def items(*args):
+        yield create_train("K", [])
+        raise ValueError("Incomplete JSON")
+
+    with patch("alarmpi.utils.http_client.get") as mock_get, \
+            patch.object(get_next_trains, "ijson", Mock(items=items)):
+        mock_get.return_value.status_code = 200
+        res = parser.run()
+
+    assert res == {"error": {"message": "Incomplete JSON", "status_code": 503}}
+    # The response is closed to release its connection back to the pool
+    mock_get.return_value.__exit__.assert_called_once()
+
+def create_train(line, rows, category="Commuter"):
+    """Create an API response train with the given timetable rows."""
+    return {
+        "commuterLineID": line,
+        "cancelled": False,
+        "timetableType": "REGULAR",
+        "trainCategory": category,
+        "timeTableRows": rows + [{"type": "ARRIVAL", "stationShortCode": "HKI", "scheduledTime": "2021-07-30T06:00:00.000Z"}]
+    }
+
+def test_next_departures_sorted_and_limited():
+    """Are departures from the station sorted by their estimated time and limited
+    to the configured count, skipping departed trains and other stations?
+    """
+    parser = get_next_trains.TrainParser({"station_code": "KE", "trains": 2})
+    trains = [
+        create_train("K", [{"type": "DEPARTURE", "stationShortCode": "KE", "scheduledTime": "2021-07-30T05:10:00.000Z"}]),
+        create_train("R", [{"type": "DEPARTURE", "stationShortCode": "KE", "scheduledTime": "2021-07-30T05:00:00.000Z",
+                            "liveEstimateTime": "2021-07-30T05:20:00.000Z"}]),
+        create_train("U", [{"type": "DEPARTURE", "stationShortCode": "KE", "scheduledTime": "2021-07-30T05:15:00.000Z"}]),
+        create_train("Z", [{"type": "DEPARTURE", "stationShortCode": "KE", "scheduledTime": "2021-07-30T05:01:00.000Z",
+                            "actualTime": "2021-07-30T05:01:00.000Z"}]),
+        create_train("A", [{"type": "DEPARTURE", "stationShortCode": "TKL", "scheduledTime": "2021-07-30T05:02:00.000Z"}]),
+        create_train("IC", [{"type": "DEPARTURE", "stationShortCode": "KE", "scheduledTime": "2021-07-30T05:03:00.000Z"}],
+                     category="LongDistance"),
+    ]
+
+    # Departures can be formatted from a stream of trains
+    departures = parser.format_next_departures(iter(trains))
+    assert [row["commuterLineID"] for row in departures] == ["K", "U"]
+
+    expected = datetime(2021, 7, 30, 5, 10, tzinfo=tz.tzutc())
+    assert departures[0]["scheduledTime"] == expected
+    assert departures[0]["scheduledTime"].tzinfo == get_next_trains.TZ_LOCAL
+
 def test_failing_weather_api_request():
     """Test responses sent on failing weather API calls"""
     # Mock opening non existing credentials file
@@ -30,7 +94,7 @@ def test_failing_weather_api_request():
         parser = get_weather.OpenWeatherMapClient(section_data)
 
     # Error raised during request
-    with patch("requests.get") as mock_get:
+    with patch("alarmpi.utils.http_client.get") as mock_get:
         mock_get.side_effect = requests.exceptions.RequestException("Network error")
         res = parser.fetch_and_format_weather()
         assert res == {"error": {"message": "Network error", "status_code": 503}}
@@ -40,8 +104,330 @@ def test_failing_weather_api_request():
         parser.content = "Failed to read openweathermap.org. "
 
     # Invalid response
-    with patch("requests.get") as mock_get:
+    with patch("alarmpi.utils.http_client.get") as mock_get:
         mock_get.return_value.status_code = 500
         mock_get.return_value.text = "Something went wrong"
         res = parser.fetch_and_format_weather()
         assert res == {"error": {"message": "Something went wrong", "status_code": 500}}
+
+def test_translate_tts_parts_joined_in_order():
+    """Are concurrently synthesized Google Translate parts joined in the original order?"""
+    client = get_google_translate_tts.GoogleTranslateTTSManager()
+    text = " ".join(["a" * 150, "b" * 150, "c" * 150])
+
+    # Use the first character of each part as the audio content
+    def fetch_part(part):
+        return pydub.AudioSegment(data=part[0].encode() * 100, sample_width=1, frame_rate=1000, channels=1)
+
+    with patch.object(client, "fetch_part", side_effect=fetch_part):
+        audio = client.setup(text)
+
+    assert audio.raw_data == b"a" * 100 + b"b" * 100 + b"c" * 100
+
+@pytest.fixture
+def gcp_client_pool():
+    """Clear the GCP clients and credential refreshes shared between instances after a test."""
+    yield get_gcp_tts._client_pool
+    for timer in get_gcp_tts._refresh_timers.values():
+        timer.cancel()
+    get_gcp_tts._refresh_timers.clear()
+    get_gcp_tts._refresh_threads.clear()
+    get_gcp_tts._client_pool.clear()
+
+@patch("alarmpi.handlers.get_gcp_tts.texttospeech.TextToSpeechClient")
+@patch("alarmpi.handlers.get_gcp_tts.fetch_service_account_access_token")
+def test_gcp_client_reused(mock_fetch_token, mock_client, gcp_client_pool):
+    """Are credentials and the API client created only once per service account?"""
+    auth = {"service_account": "test@example.iam.gserviceaccount.com"}
+    first = get_gcp_tts.GoogleCloudTTS(auth)
+    second = get_gcp_tts.GoogleCloudTTS(auth)
+
+    assert first.client is second.client
+    mock_fetch_token.assert_called_once()
+    mock_client.assert_called_once()
+
+@patch("alarmpi.handlers.get_gcp_tts.texttospeech.TextToSpeechClient")
+@patch("alarmpi.handlers.get_gcp_tts.fetch_service_account_access_token")
+def test_gcp_synthesize_waits_for_credentials_refresh(mock_fetch_token, mock_client, gcp_client_pool):
+    """Does synthesizing wait for a credentials refresh started by prepare?"""
+    auth = {"service_account": "test@example.iam.gserviceaccount.com"}
+    client = get_gcp_tts.GoogleCloudTTS(auth)
+    client.credentials.expiry = None
+    refreshed = []
+
+    def refresh(credentials):
+        time.sleep(0.1)
+        refreshed.append(credentials)
+
+    def synthesize_speech(**kwargs):
+        assert refreshed
+        return Mock(audio_content=b"")
+
+    mock_client.return_value.synthesize_speech.side_effect = synthesize_speech
+    with patch("alarmpi.handlers.get_gcp_tts.refresh_credentials", side_effect=refresh), \
+            patch("alarmpi.handlers.get_gcp_tts.pydub.AudioSegment.from_file"):
+        client.prepare()
+        client.prepare()
+        client.setup("Good morning")
+
+    assert refreshed == [client.credentials]
+
+@patch("alarmpi.handlers.get_gcp_tts.texttospeech.TextToSpeechClient")
+@patch("alarmpi.handlers.get_gcp_tts.fetch_service_account_access_token")
+def test_gcp_credentials_kept_fresh_until_alarm(mock_fetch_token, mock_client, gcp_client_pool):
+    """Are credentials fetched in the background by prepare and refreshed again before
+    they expire if the alarm is later?
+    """
+    auth = {"service_account": "test@example.iam.gserviceaccount.com"}
+    utc_now = datetime.now(timezone.utc).replace(tzinfo=None)
+    mock_fetch_token.return_value.expiry = utc_now + timedelta(seconds=get_gcp_tts.CREDENTIALS_LIFETIME)
+    client = get_gcp_tts.GoogleCloudTTS(auth)
+    mock_fetch_token.assert_not_called()
+
+    client.prepare(until=datetime.now() + timedelta(hours=1))
+    client.wait_for_refresh()
+    mock_fetch_token.assert_called_once()
+    timer = get_gcp_tts._refresh_timers[auth["service_account"]]
+    assert timer.interval == pytest.approx(get_gcp_tts.CREDENTIALS_LIFETIME - get_gcp_tts.CREDENTIALS_REFRESH_MARGIN, abs=2)
+
+    # Credentials outlasting the alarm are not refreshed again
+    timer.cancel()
+    get_gcp_tts._refresh_timers.clear()
+    client.prepare(until=datetime.now() + timedelta(minutes=1))
+    client.wait_for_refresh()
+    assert not get_gcp_tts._refresh_timers
+
+def test_shared_session_applies_default_timeout():
+    """Do requests sent via the shared HTTP client get a default timeout?"""
+    with patch("requests.Session.request") as mock_request:
+        http_client.get("http://example.com")
+        assert mock_request.call_args.kwargs["timeout"] == http_client.DEFAULT_TIMEOUT
+
+        http_client.get("http://example.com", timeout=1)
+        assert mock_request.call_args.kwargs["timeout"] == 1
+
+@pytest.fixture
+def news_feed_cache(shared_content_cache):
+    """Clear the stories and validators of the BBC News feed after a test."""
+    yield get_bbc_news._feed_cache
+    get_bbc_news._feed_cache.update({"etag": None, "last_modified": None, "stories": None})
+
+def test_unmodified_news_feed_reused(news_feed_cache, shared_content_cache):
+    """Are stories reused without a request within the TTL, and is a conditional request
+    sent for the BBC News feed and the previous stories reused when the feed has not changed?
+    """
+    rss = (
+        "<rss version='2.0'><channel><title>BBC News</title>"
+        "<item><title>Headline</title><description>Summary</description></item>"
+        "</channel></rss>"
+    )
+    modified = Mock(status_code=200, content=rss.encode(), headers={"ETag": "abc"})
+    not_modified = Mock(status_code=304, content=b"", headers={})
+    parser = get_bbc_news.NewsParser({})
+
+    with patch("alarmpi.utils.http_client.get") as mock_get:
+        mock_get.side_effect = [modified, not_modified]
+        parser.build()
+        first = parser.get()
+        parser.build()
+        mock_get.assert_called_once()
+
+        # Expire the stories in the content cache
+        shared_content_cache.clear()
+        parser.build()
+
+        assert mock_get.call_args.kwargs["headers"] == {"If-None-Match": "abc"}
+        assert parser.get() == first
+        assert "Headline.\nSummary" in first
+
+def test_weather_icon_read_from_cache(tmp_path):
+    """Is a weather icon fetched only once and then read from the disk cache?"""
+    with patch("alarmpi.handlers.get_weather.ICON_CACHE_DIR", str(tmp_path)), \
+            patch("alarmpi.utils.http_client.get") as mock_get:
+        mock_get.return_value = Mock(status_code=200, content=b"png")
+
+        assert get_weather.OpenWeatherMapClient.get_weather_icon("01d") == b"png"
+        assert get_weather.OpenWeatherMapClient.get_weather_icon("01d") == b"png"
+        mock_get.assert_called_once()
+
+def test_weather_icon_returned_when_caching_fails(tmp_path):
+    """Is a fetched weather icon returned even if writing it to the disk cache fails?"""
+    with patch("alarmpi.handlers.get_weather.ICON_CACHE_DIR", str(tmp_path)), \
+            patch("alarmpi.utils.http_client.get") as mock_get, \
+            patch("alarmpi.handlers.get_weather.os.replace", side_effect=FileNotFoundError):
+        mock_get.return_value = Mock(status_code=200, content=b"png")
+        assert get_weather.OpenWeatherMapClient.get_weather_icon("01d") == b"png"
+
+
+class FakeBroker:
+    """Local stand-in for the DigiTraffic MQTT broker delivering published
+    messages to subscribed clients.
+    """
+
+    def __init__(self):
+        self.subscriptions = {}
+
+    def publish(self, topic, payload):
+        for client in self.subscriptions.get(topic, []):
+            client.on_message(client, None, Mock(topic=topic, payload=json.dumps(payload).encode()))
+
+
+class FakeClient:
+    """MQTT client connected to a FakeBroker."""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.on_connect = None
+        self.on_message = None
+
+    def connect_async(self, host, port):
+        pass
+
+    def loop_start(self):
+        self.on_connect(self, None, {}, 0)
+
+    def subscribe(self, topic):
+        self.broker.subscriptions.setdefault(topic, []).append(self)
+
+    def disconnect(self):
+        for clients in self.broker.subscriptions.values():
+            clients.remove(self)
+
+    def loop_stop(self):
+        pass
+
+def create_departing_train(number, scheduled_time, **row):
+    """Create an API response train departing from KE at the given time."""
+    scheduled_time = scheduled_time.astimezone(tz.tzutc()).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    train = create_train("K", [{"type": "DEPARTURE", "stationShortCode": "KE", "scheduledTime": scheduled_time, **row}])
+    train.update({"trainNumber": number, "departureDate": "2021-07-30"})
+    return train
+
+def test_pushed_train_updates_merged_to_departures():
+    """Are train updates received for the station merged to the departures table?"""
+    broker = FakeBroker()
+    parser = get_next_trains.TrainParser({"station_code": "KE", "trains": 3})
+    table = get_train_updates.DeparturesTable(parser)
+    connected = Mock()
+    listener = get_train_updates.TrainUpdateListener(
+        "KE", on_train=table.update, on_connect=connected, client=FakeClient(broker)
+    )
+    listener.start()
+    connected.assert_called_once()
+
+    soon = datetime.now(tz=tz.tzlocal()) + timedelta(hours=1)
+    broker.publish("trains-by-station/KE", create_departing_train(1, soon + timedelta(minutes=10)))
+    broker.publish("trains-by-station/KE", create_departing_train(2, soon))
+    broker.publish("trains-by-station/TKL", create_departing_train(3, soon))
+    expected = [soon.replace(microsecond=0), soon.replace(microsecond=0) + timedelta(minutes=10)]
+    assert [row["scheduledTime"] for row in table.next_departures(3)] == expected
+
+    # An unchanged train does not change the table, a departed train is removed
+    assert not table.update(create_departing_train(1, soon + timedelta(minutes=10)))
+    broker.publish("trains-by-station/KE", create_departing_train(2, soon, actualTime="2021-07-30T05:00:00.000Z"))
+    assert len(table.next_departures(3)) == 1
+
+    listener.stop()
+    broker.publish("trains-by-station/KE", create_departing_train(2, soon))
+    assert len(table.next_departures(3)) == 1
+
+def test_stale_content_served_while_refreshed():
+    """Is fresh content shared from the cache and stale content returned immediately
+    while it is refreshed in the background?
+    """
+    cache = apcontent.ContentCache()
+    fetch = Mock(side_effect=["first", "second"])
+
+    assert cache.get("weather", fetch, ttl=60, max_stale=60) == "first"
+    assert cache.get("weather", fetch, ttl=60, max_stale=60) == "first"
+    assert fetch.call_count == 1
+
+    # Age the entry past its TTL
+    data, fetched_at = cache.entries["weather"]
+    cache.entries["weather"] = (data, fetched_at - 90)
+    assert cache.get("weather", fetch, ttl=60, max_stale=60) == "first"
+
+    for _ in range(100):
+        if not cache.refreshing:
+            break
+        time.sleep(0.01)
+    assert cache.get("weather", fetch, ttl=60, max_stale=60) == "second"
+    assert fetch.call_count == 2
+
+def test_concurrent_misses_fetched_once():
+    """Do concurrent requests for content missing from the cache share a single fetch?"""
+    cache = apcontent.ContentCache()
+
+    def fetch():
+        time.sleep(0.1)
+        return "weather"
+
+    fetch = Mock(side_effect=fetch)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("weather", fetch, ttl=60))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["weather"] * 3
+    fetch.assert_called_once()
+
+def test_stale_content_used_if_fetch_fails():
+    """Is stale content only returned when fetching fresh content fails?"""
+    cache = apcontent.ContentCache()
+    error = {"error": {"message": "Network error", "status_code": 503}}
+    fetch = Mock(side_effect=["first", "second", error, error])
+    cache.get("weather", fetch, ttl=60)
+
+    # Age the entry past its TTL: fresh content is fetched while it can be
+    data, fetched_at = cache.entries["weather"]
+    cache.entries["weather"] = (data, fetched_at - 90)
+    assert cache.get("weather", fetch, ttl=60, stale_if_error=60) == "second"
+
+    data, fetched_at = cache.entries["weather"]
+    cache.entries["weather"] = (data, fetched_at - 90)
+    assert cache.get("weather", fetch, ttl=60, stale_if_error=60) == "second"
+    assert cache.get("weather", fetch, ttl=60) == error
+
+@pytest.fixture
+def shared_content_cache():
+    """Clear the shared content cache after a test."""
+    yield apcontent.content_cache
+    apcontent.content_cache.clear()
+
+def test_weather_fetched_once_for_plugin_and_alarm(shared_content_cache):
+    """Do the weather plugin and the alarm share a weather response?"""
+    section_data = {"credentials": None, "city_id": 1, "units": "metric"}
+    with patch("builtins.open", mock_open(read_data="key")):
+        parser = get_weather.OpenWeatherMapClient(section_data)
+
+    with patch.object(parser, "request_weather", return_value={"main": {}}) as mock_request:
+        parser.get_weather()
+        parser.get_weather()
+        mock_request.assert_called_once()
+
+def test_alarm_uses_plugin_weather_while_refreshed(shared_content_cache):
+    """Does the alarm read a weather response fetched by the plugin past the TTL
+    and refresh it in the background?
+    """
+    section_data = {"credentials": None, "city_id": 1, "units": "metric"}
+    with patch("builtins.open", mock_open(read_data="key")):
+        parser = get_weather.OpenWeatherMapClient(section_data)
+
+    with patch.object(parser, "request_weather", return_value={"main": {}}) as mock_request:
+        parser.get_weather()
+
+        # Age the response past the TTL, as between the plugin's refreshes
+        key = ("OpenWeatherMapClient", 1)
+        data, fetched_at = shared_content_cache.entries[key]
+        shared_content_cache.entries[key] = (data, fetched_at - parser.CACHE_TTL - 60)
+
+        mock_request.return_value = {"main": {"temp": 1}}
+        assert parser.get_weather(max_stale=parser.CACHE_MAX_STALE) == {"main": {}}
+        for _ in range(50):
+            if key not in shared_content_cache.refreshing:
+                break
+            time.sleep(0.01)
+        assert mock_request.call_count == 2
+        assert parser.get_weather() == {"main": {"temp": 1}}
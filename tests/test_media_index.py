@@ -0,0 +1,64 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from alarmpi.utils import media_index
+
+
+@pytest.fixture
+def media_dir(tmp_path):
+    path = tmp_path / "media"
+    path.mkdir()
+    for name in ("a.mp3", "b.mp3", "c.mp3"):
+        (path / name).write_bytes(b"")
+    return path
+
+@pytest.fixture
+def index(tmp_path):
+    return media_index.MediaIndex(str(tmp_path / "media.sqlite"))
+
+def test_update_only_reads_new_and_modified_files(index, media_dir):
+    """Is metadata only read for files added or modified since the last update?"""
+    pattern = str(media_dir / "*.mp3")
+    assert index.update(pattern) == 3
+    assert index.update(pattern) == 0
+
+    os.utime(media_dir / "a.mp3", (0, 0))
+    (media_dir / "d.mp3").write_bytes(b"")
+    with patch("alarmpi.utils.media_index.MediaIndex.read_metadata", wraps=media_index.MediaIndex.read_metadata) as mock_read:
+        assert index.update(pattern) == 2
+
+    assert sorted(os.path.basename(call.args[0]) for call in mock_read.call_args_list) == ["a.mp3", "d.mp3"]
+
+def test_removed_files_not_chosen(index, media_dir):
+    """Are files no longer matching the pattern removed from the index?"""
+    pattern = str(media_dir / "*.mp3")
+    index.update(pattern)
+    os.remove(media_dir / "a.mp3")
+    os.remove(media_dir / "b.mp3")
+    index.update(pattern)
+
+    for _ in range(3):
+        assert index.choose()["path"] == str(media_dir / "c.mp3")
+
+def test_no_repeat_plays_every_song_once(index, media_dir):
+    """Is every song chosen once before any song is repeated?"""
+    index.update(str(media_dir / "*.mp3"))
+
+    chosen = []
+    for _ in range(3):
+        song = index.choose()
+        index.mark_played(song["path"])
+        chosen.append(song["title"])
+    assert sorted(chosen) == ["a.mp3", "b.mp3", "c.mp3"]
+
+def test_choose_does_not_mark_played(index, media_dir):
+    """Are songs only excluded by no_repeat once they have been played?"""
+    index.update(str(media_dir / "*.mp3"))
+    for _ in range(3):
+        index.choose()
+
+    index.mark_played(str(media_dir / "a.mp3"))
+    for _ in range(5):
+        assert index.choose()["title"] in ("b.mp3", "c.mp3")
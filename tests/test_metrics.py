@@ -0,0 +1,39 @@
+import pytest
+import requests
+
+from alarmpi.utils import metrics
+
+
+def test_timed_records_totals_and_errors():
+    """Are durations, bytes and errors of measured blocks summed per stage and labels?"""
+    registry = metrics.Metrics()
+    with registry.timed("content", handler="get_bbc_news.py") as measurement:
+        measurement.bytes = 100
+
+    with pytest.raises(ValueError):
+        with registry.timed("content", handler="get_bbc_news.py"):
+            raise ValueError("feed unavailable")
+
+    totals = registry.totals[("content", (("handler", "get_bbc_news.py"),))]
+    assert totals["count"] == 2
+    assert totals["errors"] == 1
+    assert totals["bytes"] == 100
+
+def test_metrics_served_in_text_format():
+    """Does the metrics server serve the totals in the Prometheus text format?"""
+    registry = metrics.Metrics()
+    registry.record("plugin_fetch", 0.5, 2048, plugin="TrainPlugin")
+
+    server = metrics.MetricsServer(registry, port=0)
+    server.start()
+    try:
+        r = requests.get(f"http://127.0.0.1:{server.port}/metrics", timeout=5)
+        missing = requests.get(f"http://127.0.0.1:{server.port}/", timeout=5)
+    finally:
+        server.stop()
+
+    assert r.status_code == 200
+    assert 'alarmpi_stage_seconds_total{stage="plugin_fetch",plugin="TrainPlugin"} 0.5' in r.text
+    assert 'alarmpi_stage_bytes_total{stage="plugin_fetch",plugin="TrainPlugin"} 2048' in r.text
+    assert "# TYPE alarmpi_stage_last_seconds gauge" in r.text
+    assert missing.status_code == 404
@@ -1,3 +1,4 @@
+import time
 import pytest
 from unittest import mock
 
@@ -12,31 +13,66 @@ def enable_pi():
 def disable_pi():
     rpi_utils.IS_RASPBERRY_PI = False
 
-def test_set_value_when_pi(enable_pi):
+@pytest.fixture()
+def backlight(tmp_path):
+    brightness_file = tmp_path / "brightness"
+    power_file = tmp_path / "bl_power"
+    brightness_file.write_text("12\n")
+    power_file.write_text("0\n")
+
+    backlight = rpi_utils.Backlight(str(brightness_file), str(power_file))
+    yield backlight
+    backlight.close()
+
+def test_set_value_when_pi(enable_pi, backlight):
     """Is file written to when running on a Raspberry Pi?"""
-    with mock.patch("builtins.open", mock.mock_open()) as mock_file:
-        rpi_utils._set_value("test.txt", 42)
+    backlight.set_brightness(42)
 
-        mock_file.assert_called_once_with("test.txt", "w")
-        mock_file().write.assert_called_once_with("42")
+    with open(backlight.files["brightness"]) as f:
+        assert f.read().startswith("42")
 
-def test_set_value_when_not_pi(disable_pi):
+def test_set_value_when_not_pi(disable_pi, backlight):
     """Is file write skipped when not running on a Raspberry Pi?"""
-    with mock.patch("builtins.open", mock.mock_open()) as mock_file:
-        rpi_utils._set_value("test.txt", 42)
+    backlight.set_brightness(42)
 
-        mock_file.assert_not_called()
+    with open(backlight.files["brightness"]) as f:
+        assert f.read() == "12\n"
 
-def test_get_value_when_pi(enable_pi):
+def test_get_value_when_pi(enable_pi, backlight):
     """Is file read from when running on a Raspberry Pi?"""
-    with mock.patch("builtins.open", mock.mock_open(read_data="1")) as mock_file:
-        rpi_utils._get_value("test.txt")
+    assert backlight.get_brightness() == 12
+    assert backlight.get_power_state() == "on"
 
-        mock_file.assert_called_once_with("test.txt")
-
-def test_get_value_when_not_pi(disable_pi):
+def test_get_value_when_not_pi(disable_pi, backlight):
     """Is file read skipped when not running on a Raspberry Pi?"""
-    with mock.patch("builtins.open", mock.mock_open(read_data="1")) as mock_file:
-        rpi_utils._get_value("test.txt")
+    assert backlight.get_brightness() is None
+
+def test_files_opened_once_and_unchanged_values_not_written(enable_pi, backlight):
+    """Are the files kept open and writes of the current value skipped?"""
+    with mock.patch("os.pwrite", wraps=rpi_utils.os.pwrite) as mock_pwrite, \
+            mock.patch("os.open", wraps=rpi_utils.os.open) as mock_open:
+        for _ in range(3):
+            backlight.get_power_state()
+            backlight.set_power_state("off")
+
+    mock_open.assert_called_once()
+    mock_pwrite.assert_called_once()
+    assert backlight.get_power_state() == "off"
+
+def test_brightness_ramp(enable_pi, backlight):
+    """Does a ramp end at the target brightness?"""
+    backlight.ramp_brightness(255, 0.1, fps=50)
+    backlight.ramp_thread.join(timeout=2)
+
+    assert backlight.get_brightness() == 255
+    with open(backlight.files["brightness"]) as f:
+        assert f.read().startswith("255")
+
+def test_set_brightness_cancels_ramp(enable_pi, backlight):
+    """Does setting brightness stop a running ramp?"""
+    backlight.ramp_brightness(255, 10)
+    time.sleep(0.1)
+    backlight.set_brightness(100)
 
-        mock_file.assert_not_called()
+    assert backlight.ramp_thread is None
+    assert backlight.get_brightness() == 100
@@ -0,0 +1,26 @@
+import importlib
+import sys
+
+from alarmpi.utils import startup_profile
+
+
+def test_import_and_phase_timings_recorded(tmp_path, monkeypatch):
+    """Are imports made while profiling and named phases included in the report?"""
+    (tmp_path / "profiled_module.py").write_text("import time\ntime.sleep(0.05)\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    profiler = startup_profile.StartupProfiler()
+    profiler.enable()
+    try:
+        with profiler.phase("Import module"):
+            importlib.import_module("profiled_module")
+    finally:
+        profiler.disable()
+        sys.modules.pop("profiled_module", None)
+
+    assert profiler.imports["profiled_module"] >= 0.05
+    assert profiler.phases[0][0] == "Import module"
+
+    lines = profiler.report()
+    assert any("profiled_module" in line for line in lines)
+    assert profiler.finder not in sys.meta_path
@@ -0,0 +1,31 @@
+import time
+from unittest.mock import patch
+
+from PyQt5.QtCore import QCoreApplication
+
+from alarmpi.utils import volume
+
+
+@patch("alarmpi.utils.volume.alsaaudio", None)
+@patch("alarmpi.utils.utils.set_volume")
+def test_slider_drag_merged_to_latest_level(mock_set_volume):
+    """Are rapid volume changes written once with the latest level?"""
+    controller = volume.VolumeController(card=1, write_interval=50)
+    for level in range(10, 60, 5):
+        controller.set_volume(level)
+
+    mock_set_volume.assert_not_called()
+
+    end = time.monotonic() + 1
+    while not mock_set_volume.called and time.monotonic() < end:
+        QCoreApplication.processEvents()
+        time.sleep(0.01)
+
+    mock_set_volume.assert_called_once_with(1, 55)
+
+@patch("alarmpi.utils.volume.alsaaudio", None)
+@patch("alarmpi.utils.utils.get_volume", side_effect=FileNotFoundError("amixer"))
+def test_unreadable_volume_returns_none(mock_get_volume):
+    """Is a volume level that cannot be read returned as None?"""
+    controller = volume.VolumeController(card=1)
+    assert controller.get_volume() is None